@@ -0,0 +1,166 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from engine import get_genre
+from export import EXTENSIONS
+from mxl import ZIP_DATE_TIME, file_name_for
+
+# Sharded archive export for batches.
+#
+# Instead of one file per song, a batch is written as shards of shard_size
+# songs each (shard-00000.zip, ...). Songs are generated, and for zip shards
+# compressed and checksummed, in chunks across a pool of worker processes;
+# this process consumes the results in order and streams each shard front
+# to back: the file is opened once, written sequentially through a large
+# buffer, never seeked, and renamed into place when complete. So every
+# worker stays busy however few shards there are. A tar.gz shard is one
+# gzip stream, which only its writer can compress. manifest.jsonl maps every
+# song to its shard and member name. --compression and --compresslevel
+# apply to the .mxl songs themselves and to the MIDI and WAV members of zip
+# shards.
+
+ARCHIVES = ["zip", "tar", "tar.gz"]
+SHARD_BUFFER = 1024 * 1024
+# Most songs a worker renders per task.
+CHUNK_SONGS = 16
+MANIFEST = "manifest.jsonl"
+
+class SequentialWriter:
+    # Forwards writes to a file but refuses to seek, so zipfile streams
+    # entries with data descriptors instead of going back to patch headers.
+    def __init__(self, f):
+        self.f = f
+        self.position = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation("sequential output")
+
+    def flush(self):
+        self.f.flush()
+
+def shard_name(index, archive):
+    return f"shard-{index:05d}.{archive}"
+
+def member_name(title, output_format, taken):
+    # taken maps every member name used in the shard to the last suffix tried for it.
+    base = file_name_for(title) + EXTENSIONS[output_format]
+    stem, extension = os.path.splitext(base)
+    name = base
+    while name in taken:
+        taken[base] += 1
+        name = f"{stem}-{taken[base]}{extension}"
+    taken[name] = 1
+    return name
+
+def render(archive, job):
+    # (manifest row, payload, CRC, compress_type) for a batch job tuple (see
+    # batch.build_jobs()). For zip shards the payload is the member's data
+    # already compressed as it will be stored, with its CRC; for tar shards
+    # it is the song itself.
+    genre, title, composer, seed, _, output_format, exporter, compression, compresslevel, melody_model, _, _ = job
+    generator = get_genre(genre)
+    data = generator.generate_song(title, composer, seed=seed, output=io.BytesIO(), output_format=output_format,
+                                   exporter=exporter, compression=compression,
+                                   compresslevel=compresslevel, melody_model=melody_model).getvalue()
+    row = {"genre": genre, "title": title, "composer": composer, "seed": seed, "format": output_format,
+           "bytes": len(data)}
+    if archive != "zip":
+        return row, data, None, None
+    if output_format == "mxl" or compression == zipfile.ZIP_STORED:
+        # .mxl songs are already compressed as asked; compressing them again only costs time.
+        return row, data, zlib.crc32(data), zipfile.ZIP_STORED
+    # Raw deflate, as zipfile itself writes ZIP_DEFLATED members.
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel,
+                                  zlib.DEFLATED, -15)
+    return row, compressor.compress(data) + compressor.flush(), zlib.crc32(data), zipfile.ZIP_DEFLATED
+
+def render_chunk(chunk):
+    # Runs in a worker process: render() for each job of a chunk.
+    archive, jobs = chunk
+    return [render(archive, job) for job in jobs]
+
+def write_compressed(zipf, info, payload):
+    # Appends a member whose data is already compressed, with info.CRC and
+    # info.file_size set. zipfile has no public call for this; it mirrors
+    # ZipFile.open(info, "w") and _ZipWriteFile.close(), but the sizes are
+    # known up front, so the header needs no data descriptor.
+    info.compress_size = len(payload)
+    info.header_offset = zipf.fp.tell()
+    zipf._writecheck(info)
+    zipf._didModify = True
+    zipf.fp.write(info.FileHeader())
+    zipf.fp.write(payload)
+    zipf.start_dir = zipf.fp.tell()
+    zipf.filelist.append(info)
+    zipf.NameToInfo[info.filename] = info
+
+def write_shard(path, archive, songs):
+    # Writes the rendered songs into one shard front to back; returns its manifest rows.
+    temp_path = path + ".tmp"
+    name = os.path.basename(path)
+    rows = []
+    taken = {}
+    with open(temp_path, "wb", buffering=SHARD_BUFFER) as f:
+        if archive == "zip":
+            with zipfile.ZipFile(SequentialWriter(f), "w") as zipf:
+                for row, payload, crc, compress_type in songs:
+                    member = member_name(row["title"], row["format"], taken)
+                    info = zipfile.ZipInfo(member, date_time=ZIP_DATE_TIME)
+                    info.compress_type = compress_type
+                    info.CRC = crc
+                    info.file_size = row["bytes"]
+                    info.external_attr = 0o644 << 16
+                    write_compressed(zipf, info, payload)
+                    rows.append({"member": member, **row, "shard": name})
+        else:
+            with tarfile.open(fileobj=f, mode="w|gz" if archive == "tar.gz" else "w|") as tar:
+                for row, payload, _, _ in songs:
+                    member = member_name(row["title"], row["format"], taken)
+                    info = tarfile.TarInfo(member)
+                    info.size = len(payload)
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(payload))
+                    rows.append({"member": member, **row, "shard": name})
+    os.replace(temp_path, path)
+    return rows
+
+def ordered_results(executor, func, items, window):
+    # Like executor.map(), but with at most window items in flight, so
+    # results waiting for the writer do not pile up in memory.
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def run_archive(jobs, output_dir, archive="zip", shard_size=1000, workers=None):
+    # Writes every shard and the manifest; returns the number of shards.
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, min(CHUNK_SONGS, len(jobs) // (workers * 4)))
+    chunks = [(archive, jobs[start:start + chunk_size]) for start in range(0, len(jobs), chunk_size)]
+    shards = range(0, len(jobs), shard_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(os.path.join(output_dir, MANIFEST), "w") as manifest:
+        songs = (song for rendered in ordered_results(executor, render_chunk, chunks, workers * 4)
+                 for song in rendered)
+        for index, _ in enumerate(shards):
+            path = os.path.join(output_dir, shard_name(index, archive))
+            for row in write_shard(path, archive, islice(songs, shard_size)):
+                manifest.write(json.dumps(row) + "\n")
+    return len(shards)
@@ -0,0 +1,118 @@
+import os
+import wave
+from functools import lru_cache
+import numpy as np
+from events import REST
+from midi import TEMPO
+from mxl import file_name_for
+from profiling import stage
+
+# Offline WAV renderer for generated scores.
+#
+# Every MIDI pitch gets a precomputed single-cycle wavetable, band-limited so
+# its harmonics stay under Nyquist. A note is the pitch's table read at the
+# note's frequency times an ADSR envelope, cached per (pitch, length) and
+# then mixed into the output with one slice add. The mix is produced and
+# written in fixed-size chunks, so memory stays flat however long the piece.
+
+SAMPLE_RATE = 44100
+SECONDS_PER_QUARTER = TEMPO / 1_000_000
+SAMPLES_PER_QUARTER = int(SAMPLE_RATE * SECONDS_PER_QUARTER)
+CHUNK_FRAMES = 1 << 16
+
+TABLE_SIZE = 2048
+HARMONICS = 12
+AMPLITUDE = 0.12
+
+ATTACK = int(0.01 * SAMPLE_RATE)
+DECAY = int(0.15 * SAMPLE_RATE)
+SUSTAIN = 0.5
+RELEASE = int(0.25 * SAMPLE_RATE)
+
+def wav_path_for(title, output_dir="."):
+    return os.path.join(output_dir, file_name_for(title) + ".wav")
+
+def frequency(midi):
+    return 440.0 * 2.0 ** ((midi - 69) / 12)
+
+@lru_cache(maxsize=None)
+def wavetable(midi):
+    # One cycle of a bright, piano-like tone: harmonic k at 1/k^1.5.
+    phase = np.arange(TABLE_SIZE) * (2 * np.pi / TABLE_SIZE)
+    table = np.zeros(TABLE_SIZE)
+    for k in range(1, HARMONICS + 1):
+        if k * frequency(midi) >= SAMPLE_RATE / 2:
+            break
+        table += np.sin(k * phase) / k ** 1.5
+    return (table / np.abs(table).max()).astype(np.float32)
+
+@lru_cache(maxsize=None)
+def envelope(held):
+    # Attack and decay to the sustain level while the note is held, then release.
+    t = np.arange(held)
+    body = np.interp(t, [0, ATTACK, ATTACK + DECAY], [0.0, 1.0, SUSTAIN])
+    level = body[-1] if held else 0.0
+    release = np.linspace(level, 0.0, RELEASE, endpoint=False)
+    return np.concatenate([body, release]).astype(np.float32)
+
+@lru_cache(maxsize=128)
+def note_block(midi, held):
+    # The whole rendered note, release tail included.
+    shape = envelope(held)
+    step = frequency(midi) * TABLE_SIZE / SAMPLE_RATE
+    index = (np.arange(len(shape)) * step).astype(np.int64) % TABLE_SIZE
+    return wavetable(midi)[index] * shape * AMPLITUDE
+
+def note_table(events):
+    # (start sample, held samples, midi) for every sounding note, ordered by start.
+    pitch = np.frombuffer(events.pitch, dtype=np.int16)
+    onset = np.frombuffer(events.onset, dtype=np.float64)
+    duration = np.frombuffer(events.duration, dtype=np.float64)
+    rows = pitch != REST
+    start = np.rint(onset[rows] * SAMPLES_PER_QUARTER).astype(np.int64)
+    held = np.rint(duration[rows] * SAMPLES_PER_QUARTER).astype(np.int64)
+    order = np.argsort(start, kind="stable")
+    return start[order], held[order], pitch[rows][order]
+
+def render_chunks(events, chunk_frames=CHUNK_FRAMES):
+    # Yields float32 blocks of at most chunk_frames samples covering the whole piece.
+    start, held, midi = note_table(events)
+    if not len(start):
+        return
+    end = start + held + RELEASE
+    total = int(end.max())
+
+    active = []
+    next_note = 0
+    for chunk_start in range(0, total, chunk_frames):
+        chunk_end = min(chunk_start + chunk_frames, total)
+        while next_note < len(start) and start[next_note] < chunk_end:
+            active.append(next_note)
+            next_note += 1
+        active = [i for i in active if end[i] > chunk_start]
+
+        mix = np.zeros(chunk_end - chunk_start, dtype=np.float32)
+        for i in active:
+            block = note_block(int(midi[i]), int(held[i]))
+            lo = max(int(start[i]), chunk_start)
+            hi = min(int(end[i]), chunk_end)
+            mix[lo - chunk_start:hi - chunk_start] += block[lo - start[i]:hi - start[i]]
+        yield mix
+
+def duration_seconds(events):
+    start, held, _ = note_table(events)
+    return float((start + held).max() + RELEASE) / SAMPLE_RATE if len(start) else 0.0
+
+def write_wav(events, target, chunk_frames=CHUNK_FRAMES):
+    # target may be a path or any writable binary file-like object.
+    with wave.open(target, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        for mix in render_chunks(events, chunk_frames):
+            out.writeframes((np.clip(mix, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return target
+
+def export_wav(events, target, profiler=None):
+    with stage(profiler, "audio"):
+        return write_wav(events, target)
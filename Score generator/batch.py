@@ -0,0 +1,148 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from archive import ARCHIVES, run_archive
+from cache import DEFAULT_MAX_BYTES, OutputCache
+from engine import GENRE_MODULES, get_genre
+from export import FORMATS, output_path_for
+from mxl import COMPRESSIONS, EXPORTERS
+from profiling import StageProfiler
+
+def load_manifest(path):
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+# One OutputCache per worker process, keyed by (directory, max_bytes).
+CACHES = {}
+
+def build_jobs(args):
+    # None, or the StageProfiler options for every song.
+    profile = {"memory": args.profile_memory} if args.profile or args.profile_memory or args.profile_out else None
+    cache = (args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    base_seed = args.seed if args.seed is not None else random.randrange(2**32)
+
+    if args.manifest:
+        rows = load_manifest(args.manifest)
+    else:
+        rows = [{} for _ in range(args.count)]
+
+    jobs = []
+    for n, row in enumerate(rows, start=1):
+        seed = int(row["seed"]) if row.get("seed") not in (None, "") else base_seed + n
+        fields = {"n": n, "genre": args.genre, "seed": seed}
+        title = row.get("title") or args.title.format(**fields)
+        composer = row.get("composer") or args.composer.format(**fields)
+        jobs.append((args.genre, title, composer, seed, args.output_dir, args.format, args.exporter,
+                     COMPRESSIONS[args.compression], args.compresslevel, args.melody_model, profile, cache))
+    if not args.archive:
+        # Archive shards number repeated member names themselves (see archive.member_name()).
+        check_output_paths(jobs)
+    return base_seed, jobs
+
+def check_output_paths(jobs):
+    # Two songs writing one file would overwrite each other, possibly both at once.
+    titles = {}
+    for _, title, _, _, output_dir, output_format, *_ in jobs:
+        path = output_path_for(title, output_dir, output_format)
+        if path in titles:
+            raise ValueError(f"songs {titles[path]!r} and {title!r} would both be written to {path}; "
+                             f"give them distinct titles or use --archive")
+        titles[path] = title
+
+def generate_one(job):
+    genre, title, composer, seed, output_dir, output_format, exporter, compression, compresslevel, melody_model, profile, cache = job
+    generator = get_genre(genre)
+    profiler = StageProfiler(genre=genre, title=title, seed=seed, **profile) if profile else None
+    options = {"exporter": exporter, "compression": compression, "compresslevel": compresslevel,
+               "melody_model": melody_model}
+    start = time.perf_counter()
+    if cache is None:
+        path = generator.generate_song(title, composer, seed=seed, output_dir=output_dir, profiler=profiler,
+                                       output_format=output_format, **options)
+        hit = None
+    else:
+        if cache not in CACHES:
+            CACHES[cache] = OutputCache(*cache)
+        path, hit = CACHES[cache].generate_song(generator, genre, title, composer, seed, output_dir=output_dir,
+                                                output_format=output_format, profiler=profiler, **options)
+    return path, time.perf_counter() - start, profiler.records if profiler else [], hit
+
+def run_batch(jobs, workers=None):
+    chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(generate_one, jobs, chunksize=chunksize))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate many scores in parallel.")
+    parser.add_argument("--genre", choices=GENRE_MODULES, required=True)
+    parser.add_argument("--count", type=int, default=1, help="number of songs (ignored with --manifest)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--title", default="Song {n}", help="title template; fields: {n}, {genre}, {seed}")
+    parser.add_argument("--composer", default="Song Generator", help="composer template; same fields as --title")
+    parser.add_argument("--manifest", help="CSV or JSONL file with title, composer and optional seed per song")
+    parser.add_argument("--seed", type=int, default=None, help="base seed; song n uses seed + n")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--format", choices=FORMATS, default="mxl",
+                        help="write MusicXML (.mxl), MIDI (.mid) or WAV audio files")
+    parser.add_argument("--exporter", choices=EXPORTERS, default="fast",
+                        help="fast streaming MusicXML writer or music21's general exporter")
+    parser.add_argument("--compression", choices=sorted(COMPRESSIONS), default="deflated")
+    parser.add_argument("--compresslevel", type=int, default=None, help="zlib level 0-9 for deflated archives")
+    parser.add_argument("--melody-model", help="draw melodies from an n-gram model trained by markov.py (.npy)")
+    parser.add_argument("--cache-dir", help="serve repeated songs from (and store new ones in) this cache directory")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="evict least recently used cache entries above this size")
+    parser.add_argument("--archive", choices=ARCHIVES,
+                        help="write the batch as sharded archives plus manifest.jsonl instead of one file per song")
+    parser.add_argument("--shard-size", type=int, default=1000, help="songs per archive shard")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-song stage wall time as JSON lines")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace each stage's peak memory (tracemalloc; slows every stage down)")
+    parser.add_argument("--profile-out", help="append the JSON lines to this file instead of stderr")
+    args = parser.parse_args(argv)
+
+    if (args.archive in ("tar", "tar.gz") and args.format != "mxl"
+            and (args.compression != "deflated" or args.compresslevel is not None)):
+        parser.error("--compression and --compresslevel do not apply to MIDI or WAV songs in tar shards")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        base_seed, jobs = build_jobs(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    if args.archive:
+        shards = run_archive(jobs, args.output_dir, args.archive, args.shard_size, args.jobs)
+        elapsed = time.perf_counter() - start
+        print(f"Archived {len(jobs)} {args.genre} songs into {shards} {args.archive} shards in {elapsed:.2f}s "
+              f"({len(jobs) / elapsed:.1f} songs/sec, base seed {base_seed})")
+        return
+    results = run_batch(jobs, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    if args.profile or args.profile_memory or args.profile_out:
+        out = open(args.profile_out, "a") if args.profile_out else sys.stderr
+        for _, _, records, _ in results:
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+        if out is not sys.stderr:
+            out.close()
+
+    per_song = sum(song_time for _, song_time, _, _ in results) / max(len(results), 1)
+    print(f"Generated {len(results)} {args.genre} songs in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.1f} songs/sec, {per_song * 1000:.1f} ms/song per worker, base seed {base_seed})")
+    if args.cache_dir:
+        hits = sum(1 for _, _, _, hit in results if hit)
+        print(f"Cache: {hits} hits, {len(results) - hits} misses")
+
+if __name__ == "__main__":
+    main()
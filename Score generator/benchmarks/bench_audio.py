@@ -0,0 +1,43 @@
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import duration_seconds, envelope, note_block, wavetable, write_wav
+from engine import GENRE_MODULES, get_genre
+
+# Real-time factor of the WAV renderer: seconds of audio rendered per second
+# of wall time on one core (above 1 is faster than real time). "cold" clears
+# the wavetable, envelope and note caches first; "warm" is the best repeat.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the WAV renderer's real-time factor.")
+    parser.add_argument("--measures", type=int, action="append", help="score lengths (default: 16 and 256)")
+    parser.add_argument("--repeat", type=int, default=3, help="renders per case, the fastest is kept")
+    args = parser.parse_args(argv)
+
+    for genre in GENRE_MODULES:
+        generator = get_genre(genre)
+        for measures in args.measures or [16, 256]:
+            random.seed(1234)
+            _, events = generator.generate_events(measures=measures)
+            seconds = duration_seconds(events)
+            for cache in (wavetable, envelope, note_block):
+                cache.cache_clear()
+            cold = timed_render(events)
+            warm = min(timed_render(events) for _ in range(args.repeat))
+            print(f"{genre:<10} {measures:>5} measures  {seconds:7.1f} s audio  "
+                  f"cold {cold * 1000:7.1f} ms {seconds / cold:7.1f}x  "
+                  f"warm {warm * 1000:7.1f} ms {seconds / warm:7.1f}x real time")
+
+def timed_render(events):
+    start = time.perf_counter()
+    write_wav(events, io.BytesIO())
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ensemble import ENSEMBLES, run_parts, write_ensemble_mxl
+
+# Ensemble scores with 2 to 16 parts, as ensemble.generate_song() writes
+# them with the fast MXL exporter: every part generated and written as
+# MusicXML in this process, against the parts spread over a warm pool of
+# --jobs processes. The serial step (header, concatenation and zip) is timed
+# separately. The speedup can only approach the part count when there are
+# at least that many cores.
+
+PART_COUNTS = [2, 4, 8, 16]
+SEED = 1234
+
+def best_ms(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parallel ensemble generation.")
+    parser.add_argument("--genre", default="classical")
+    parser.add_argument("--ensemble", choices=sorted(ENSEMBLES), default="string_quintet")
+    parser.add_argument("--measures", type=int, default=2048)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{args.ensemble}, {args.measures} measures, {args.jobs} worker processes, {os.cpu_count()} CPUs")
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # Starts every worker and imports the genre there before timing.
+        list(executor.map(len, [[]] * args.jobs))
+        run_parts(args.genre, args.ensemble, measures=1, seed=SEED, count=args.jobs, executor=executor, render=True)
+        for count in PART_COUNTS:
+            serial, (_, part_texts, parts) = best_ms(args.repeat, lambda: run_parts(
+                args.genre, args.ensemble, measures=args.measures, seed=SEED, count=count, render=True))
+            parallel, _ = best_ms(args.repeat, lambda: run_parts(
+                args.genre, args.ensemble, measures=args.measures, seed=SEED, count=count, executor=executor,
+                render=True))
+            merge, _ = best_ms(args.repeat, lambda: write_ensemble_mxl(
+                part_texts, "Benchmark", "Benchmark", parts, io.BytesIO()))
+            speedup = (serial + merge) / (parallel + merge)
+            print(f"{count:3d} parts  parts {serial:8.1f} ms serial  {parallel:8.1f} ms parallel  "
+                  f"merge {merge:7.1f} ms  total {speedup:5.2f}x "
+                  f"({speedup / min(count, args.jobs):4.0%} of linear)")
+
+if __name__ == "__main__":
+    main()
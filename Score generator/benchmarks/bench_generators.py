@@ -0,0 +1,193 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import GENRE_MODULES, get_genre
+
+# End-to-end benchmark for every genre at several score lengths.
+#
+# Each (genre, measures) case runs in a fresh process so that its peak RSS is
+# its own. The stages are timed separately, best of --repeat runs:
+#   generation          random.seed() + generate_events()
+#   construction        events.to_score() (create_measure for every bar)
+#   serialize           fast MusicXML writer into memory
+#   serialize_music21   music21 GeneralObjectExporter (slow, capped by length)
+#   package             MXL zip of the serialized score, in memory
+# songs_per_sec covers the default pipeline: generation, serialize, package.
+#
+# Results are compared against benchmarks/baseline.json, which is not
+# shipped: record it with --update-baseline on the machine you compare on.
+# Without a baseline the run exits 2 unless --no-baseline is given, and a
+# case or stage the baseline does not cover fails too.
+# Every case also times a fixed pure-Python calibration loop in the same
+# process, and baseline timings are scaled by the ratio of the two
+# calibration times, so a slower or busier machine is not reported as a
+# regression. A stage that is slower than the scaled baseline by more than
+# --threshold makes the run exit 1.
+
+LENGTHS = [16, 256, 4096]
+SEED = 1234
+STAGES = ["generation", "construction", "serialize", "serialize_music21", "package"]
+CALIBRATION_LOOPS = 500_000
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3), result
+
+def calibration_loop():
+    total = 0
+    for i in range(CALIBRATION_LOOPS):
+        total += i * i % 7
+    return total
+
+def run_case(genre, measures, repeat, music21_max_measures):
+    # Calibrated first, before the stages grow the heap and slow the loop down.
+    calibration_ms, _ = best_of(repeat, calibration_loop)
+    generator = get_genre(genre)
+    from events import to_score
+    from musicxml import write_musicxml
+    from mxl import score_to_bytes, write_zip
+
+    def generate():
+        random.seed(SEED)
+        return generator.generate_events(measures=measures)
+
+    def serialize():
+        out = io.StringIO()
+        write_musicxml(out, events, "Benchmark", "Benchmark", selected_key)
+        return out.getvalue().encode("utf-8")
+
+    stages = {}
+    stages["generation"], (selected_key, events) = best_of(repeat, generate)
+    stages["serialize"], xml_bytes = best_of(repeat, serialize)
+    stages["package"], _ = best_of(repeat, lambda: write_zip("Benchmark.xml", xml_bytes, io.BytesIO()))
+    stages["construction"], score = best_of(repeat, lambda: to_score(events, "Benchmark", "Benchmark", selected_key))
+    if measures <= music21_max_measures:
+        stages["serialize_music21"], _ = best_of(repeat, lambda: score_to_bytes(score))
+
+    pipeline_ms = stages["generation"] + stages["serialize"] + stages["package"]
+    return {
+        "genre": genre,
+        "measures": measures,
+        "stages_ms": stages,
+        "calibration_ms": calibration_ms,
+        "songs_per_sec": round(1000 / pipeline_ms, 2),
+        # ru_maxrss is KiB on Linux, bytes on macOS.
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                              / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    }
+
+def case_name(result):
+    return f"{result['genre']}/{result['measures']}"
+
+def run_fresh(genre, measures, repeat, music21_max_measures):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, genre, measures, repeat, music21_max_measures).result()
+
+def regressions(results, baseline, threshold, min_ms):
+    # A stage regresses when it is slower than the baseline, scaled by the
+    # calibration loop, by more than threshold and by more than min_ms, so
+    # sub-millisecond noise on tiny scores does not fail.
+    found = []
+    for result in results:
+        case = baseline.get(case_name(result))
+        if not case or not case.get("calibration_ms"):
+            found.append(f"{case_name(result)}: not in the baseline (or recorded without calibration_ms)")
+            continue
+        expected = case.get("stages_ms", {})
+        scale = result["calibration_ms"] / case["calibration_ms"]
+        for name, elapsed in result["stages_ms"].items():
+            if name not in expected:
+                found.append(f"{case_name(result)} {name}: not in the baseline")
+                continue
+            scaled = expected[name] * scale
+            if elapsed > scaled * (1 + threshold) and elapsed - scaled > min_ms:
+                found.append(f"{case_name(result)} {name}: {elapsed:.1f} ms vs scaled baseline {scaled:.1f} ms "
+                             f"(+{(elapsed / scaled - 1) * 100:.0f}%)")
+    return found
+
+def print_table(results):
+    print(f"{'case':<16}" + "".join(f"{name:>19}" for name in STAGES) + f"{'songs/sec':>11}{'RSS MiB':>9}")
+    for result in results:
+        cells = [result["stages_ms"].get(name) for name in STAGES]
+        print(f"{case_name(result):<16}"
+              + "".join(f"{'-' if cell is None else f'{cell:.2f} ms':>19}" for cell in cells)
+              + f"{result['songs_per_sec']:>11.1f}{result['peak_rss_mib']:>9.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every genre and stage at several score lengths.")
+    parser.add_argument("--genre", choices=GENRE_MODULES, action="append", help="genres to run (default: all)")
+    parser.add_argument("--measures", type=int, action="append", help=f"score lengths (default: {LENGTHS})")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage, the fastest is kept")
+    parser.add_argument("--music21-max-measures", type=int, default=256,
+                        help="skip the music21 serializer above this length (it takes seconds per 256 bars)")
+    parser.add_argument("--json", help="also write the results to this file as JSON lines")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--no-baseline", action="store_true", help="only print the timings, without comparing")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fail if a stage is slower than the baseline by more than this fraction")
+    parser.add_argument("--min-ms", type=float, default=5.0,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+    if not (args.update_baseline or args.no_baseline or os.path.exists(args.baseline)):
+        parser.error(f"no baseline at {args.baseline}; record one with --update-baseline, "
+                     f"or pass --no-baseline to only print the timings")
+
+    results = []
+    for genre in args.genre or GENRE_MODULES:
+        for measures in args.measures or LENGTHS:
+            result = run_fresh(genre, measures, args.repeat, args.music21_max_measures)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({case_name(result): result for result in results})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if args.no_baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.threshold, args.min_ms)
+    if found:
+        print(f"REGRESSION: {len(found)} stage(s) missing from the baseline or slower than it "
+              f"by more than {args.threshold:.0%}:")
+        for line in found:
+            print("  " + line)
+        return 1
+    print(f"no stage slower than baseline by more than {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
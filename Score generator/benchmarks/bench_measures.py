@@ -0,0 +1,72 @@
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+from engine import GENRE_MODULES, get_genre
+from events import measure_template, measure_template_stats, music21_name
+
+# music21 score construction for a 4096-measure piece per genre: every
+# measure rebuilt from scratch (the create_measure() before measure
+# templates) against measure templates with a cold and a warm cache.
+
+MEASURES = 4096
+SEED = 1234
+REPEAT = 3
+
+def legacy_create_measure(measure_events, measure_number):
+    from music21 import stream, note, duration, chord
+    m = stream.Measure(number=measure_number)
+    for pitches, dur in measure_events:
+        if not pitches:
+            n = note.Rest()
+        elif len(pitches) == 1:
+            n = note.Note(music21_name(*pitches[0]))
+        else:
+            n = chord.Chord([note.Note(music21_name(*p)) for p in pitches])
+        n.duration = duration.Duration(dur)
+        m.append(n)
+    return m
+
+def best_ms(func, before=None):
+    best = None
+    for _ in range(REPEAT):
+        if before:
+            before()
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    import music21  # noqa: F401  (imported up front so it is not timed)
+    templated = events.create_measure
+    for genre in GENRE_MODULES:
+        generator = get_genre(genre)
+        selected_key, song = generator.generate_events(measures=MEASURES, rng=random.Random(SEED))
+
+        def build():
+            return events.to_score(song, "Benchmark", "Benchmark", selected_key)
+
+        events.create_measure = legacy_create_measure
+        rebuilt = best_ms(build)
+        events.create_measure = templated
+        cold = best_ms(build, before=measure_template.cache_clear)
+        measure_template.cache_clear()
+        build()
+        stats = measure_template_stats()
+        warm = best_ms(build)
+        print(f"{genre:<10} rebuild {rebuilt:8.1f} ms   templates cold {cold:8.1f} ms ({rebuilt / cold:4.2f}x)   "
+              f"warm {warm:8.1f} ms ({rebuilt / warm:4.2f}x)   "
+              f"hit rate {stats['hit_rate']:.3f} ({stats['templates']} templates)")
+
+if __name__ == "__main__":
+    main()
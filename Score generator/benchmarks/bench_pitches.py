@@ -0,0 +1,44 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pitches import to_key, transpose
+
+# The string-based transpose() the genre scripts used before pitches.py.
+def legacy_transpose(note, semitones):
+    note_order = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+    flat_note_order = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+
+    for i, char in enumerate(note):
+        if char.isdigit():
+            note_name = note[:i]
+            octave = int(note[i:])
+            break
+    else:
+        raise ValueError(f"Invalid note format: {note}")
+    if note_name in flat_note_order:
+        note_index = flat_note_order.index(note_name)
+        note_name = note_order[note_index]
+
+    note_index = note_order.index(note_name)
+    new_index = (note_index + semitones) % 12
+    new_octave = octave + (note_index + semitones) // 12
+    return note_order[new_index] + str(new_octave)
+
+def main():
+    number = 200_000
+    cases = [
+        ("legacy string transpose", lambda: legacy_transpose("Bb3", 7)),
+        ("pitches.transpose", lambda: transpose("Bb3", 7)),
+        ("pitches.to_key (cached)", lambda: to_key("Bb3", "G")),
+    ]
+    baseline = None
+    for label, func in cases:
+        per_call = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+        baseline = baseline or per_call
+        print(f"{label:<26} {per_call:8.1f} ns/call  {baseline / per_call:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import GENRE_MODULES, get_genre
+from mxl import export_events
+
+# Regression check for the fast MusicXML writer: for fixed seeds of every
+# genre, the song is exported with the fast writer and with music21's
+# exporter, both files are parsed back with music21, and their notes, rests,
+# ties, key signatures and clefs must be identical. Exits 1 on a difference.
+
+SEEDS = range(25)
+MEASURES = 16
+
+def summary(path):
+    # Per part: its notes and rests, key signatures and clefs as plain tuples.
+    from music21 import clef, converter, key
+    parts = []
+    for part in converter.parse(path).parts:
+        flat = part.flatten()
+        notes = [
+            (float(n.offset), "rest" if n.isRest else tuple(p.nameWithOctave for p in n.pitches),
+             float(n.quarterLength), n.tie.type if n.tie is not None else None)
+            for n in flat.notesAndRests
+        ]
+        keys = [(float(k.offset), k.sharps) for k in flat.getElementsByClass(key.KeySignature)]
+        clefs = [(float(c.offset), c.sign, c.line) for c in flat.getElementsByClass(clef.Clef)]
+        parts.append((notes, keys, clefs))
+    return parts
+
+def first_difference(fast, reference):
+    if len(fast) != len(reference):
+        return f"{len(fast)} parts vs {len(reference)}"
+    for index, (fast_part, reference_part) in enumerate(zip(fast, reference)):
+        for name, fast_items, reference_items in zip(("note", "key", "clef"), fast_part, reference_part):
+            for position, (a, b) in enumerate(zip(fast_items, reference_items)):
+                if a != b:
+                    return f"part {index + 1} {name} {position}: fast {a} vs music21 {b}"
+            if len(fast_items) != len(reference_items):
+                return f"part {index + 1}: {len(fast_items)} {name}s vs {len(reference_items)}"
+    return None
+
+def check(genre, seed, measures, directory):
+    selected_key, events = get_genre(genre).generate_events(measures=measures, rng=random.Random(seed))
+    summaries = []
+    for exporter in ("fast", "music21"):
+        path = os.path.join(directory, f"{genre}-{seed}-{exporter}.mxl")
+        export_events(events, "Check", "Check", selected_key, path, exporter)
+        summaries.append(summary(path))
+    return first_difference(*summaries)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the fast MusicXML writer against music21's exporter.")
+    parser.add_argument("--genre", choices=GENRE_MODULES, action="append", help="genres to check (default: all)")
+    parser.add_argument("--seeds", type=int, default=len(SEEDS), help="seeds per genre, from 0")
+    parser.add_argument("--measures", type=int, default=MEASURES)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for genre in args.genre or GENRE_MODULES:
+            for seed in range(args.seeds):
+                difference = check(genre, seed, args.measures, directory)
+                if difference:
+                    failures += 1
+                    print(f"{genre} seed {seed}: {difference}")
+            print(f"{genre}: {args.seeds} seeds checked", file=sys.stderr)
+    if failures:
+        print(f"MISMATCH: {failures} song(s) differ between the fast writer and music21")
+        return 1
+    print("fast writer and music21 exporter agree")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
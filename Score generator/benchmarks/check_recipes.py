@@ -0,0 +1,101 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import GENRE_MODULES, get_genre
+from recipe import make_recipe, materialize
+
+# Regression check for seeded output and recipes.
+#
+# For fixed seeds of every genre:
+#   - a recipe, after a JSON round trip, materializes to the same bytes
+#     twice and to the same bytes as generate_song() with the plain seed,
+#     for the fast MXL writer, MIDI and WAV;
+#   - the MusicXML (unzipped, so zlib versions do not matter) and MIDI
+#     output hash to the values in benchmarks/seeded_outputs.json.
+# A change that alters the output for a seed must bump the genre's VERSION;
+# then refresh the hashes with --update. Exits 1 on a difference.
+
+SEEDS = range(5)
+FORMATS = ["mxl", "midi", "wav"]
+HASHED_FORMATS = ["mxl", "midi"]
+EXPECTED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seeded_outputs.json")
+
+def render(recipe, output_format):
+    return materialize(recipe, output=io.BytesIO(), output_format=output_format).getvalue()
+
+def content_hash(data, output_format):
+    if output_format == "mxl":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            data = b"".join(archive.read(name) for name in sorted(archive.namelist()))
+    return hashlib.sha256(data).hexdigest()
+
+def check_genre(genre, seeds):
+    # (problems, {"seed/format": hash}) for one genre.
+    generator = get_genre(genre)
+    problems = []
+    hashes = {}
+    for seed in seeds:
+        recipe = json.loads(json.dumps(make_recipe(genre, seed, f"Check {seed}", "Check")))
+        for output_format in FORMATS:
+            first = render(recipe, output_format)
+            if render(recipe, output_format) != first:
+                problems.append(f"{genre} seed {seed} {output_format}: materializing twice gives different bytes")
+            plain = generator.generate_song(recipe["title"], recipe["composer"], seed=seed, output=io.BytesIO(),
+                                            output_format=output_format).getvalue()
+            if plain != first:
+                problems.append(f"{genre} seed {seed} {output_format}: recipe differs from the seeded song")
+            if output_format in HASHED_FORMATS:
+                hashes[f"{seed}/{output_format}"] = content_hash(first, output_format)
+    return problems, hashes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that recipes and seeded songs reproduce exactly.")
+    parser.add_argument("--expected", default=EXPECTED, help="file of expected output hashes")
+    parser.add_argument("--update", action="store_true", help="store the current hashes as the expected ones")
+    args = parser.parse_args(argv)
+
+    expected = {}
+    if os.path.exists(args.expected):
+        with open(args.expected) as f:
+            expected = json.load(f)
+
+    problems = []
+    current = {}
+    for genre in GENRE_MODULES:
+        generator = get_genre(genre)
+        genre_problems, hashes = check_genre(genre, SEEDS)
+        problems += genre_problems
+        current[genre] = {"version": generator.version, "hashes": hashes}
+        stored = expected.get(genre)
+        if args.update:
+            continue
+        if stored is None:
+            print(f"{genre}: no expected hashes; run with --update")
+        elif stored["version"] != generator.version:
+            print(f"{genre}: version {generator.version} (hashes are for {stored['version']}); run with --update")
+        else:
+            problems += [f"{genre} seed {name}: output changed without a VERSION bump"
+                         for name, value in hashes.items() if stored["hashes"].get(name) != value]
+
+    if args.update:
+        with open(args.expected, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"expected hashes written to {args.expected}")
+    if problems:
+        print(f"MISMATCH: {len(problems)} problem(s):")
+        for line in problems:
+            print("  " + line)
+        return 1
+    print("recipes and seeded songs reproduce exactly")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
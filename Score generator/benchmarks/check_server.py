@@ -0,0 +1,107 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+# Regression check for server.py's request validation: starts the server,
+# posts malformed /generate bodies and expects a 400 with a JSON error for
+# each (never a 500 or a dropped connection), then one valid request that
+# must return the file. Exits 1 on a failure.
+
+MALFORMED = [
+    b"not json",
+    b"[]",
+    b"{}",
+    b'{"genre": ["jazz"]}',
+    b'{"genre": "polka"}',
+    b'{"genre": "jazz", "format": []}',
+    b'{"genre": "jazz", "format": "flac"}',
+    b'{"genre": "jazz", "compression": []}',
+    b'{"genre": "jazz", "compression": {}}',
+    b'{"genre": "jazz", "compression": "bogus"}',
+    b'{"genre": "jazz", "exporter": ["fast"]}',
+    b'{"genre": "jazz", "key": []}',
+    b'{"genre": "jazz", "key": "Zz"}',
+    b'{"genre": "moody", "key": "C"}',
+    b'{"genre": "jazz", "compresslevel": 12}',
+    b'{"genre": "jazz", "measures": "8"}',
+    b'{"genre": "jazz", "measures": true}',
+    b'{"genre": "jazz", "measures": 0}',
+    b'{"genre": "jazz", "measures": 100000}',
+    b'{"genre": "jazz", "format": "wav", "measures": 4096}',
+    b'{"genre": "jazz", "seed": "7"}',
+    b'{"genre": "jazz", "title": 5}',
+    b'{"genre": "jazz", "output": "/tmp/x.mxl"}',
+    b'{"genre": "jazz", "melody_model": "/etc/passwd"}',
+]
+VALID = b'{"genre": "jazz", "seed": 7, "format": "midi", "measures": 8}'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def post(port, body):
+    # (status, body), or (None, error) when the connection broke.
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/generate", body)
+        response = connection.getresponse()
+        return response.status, response.read()
+    except (OSError, http.client.HTTPException) as e:
+        return None, repr(e).encode()
+    finally:
+        connection.close()
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server.py exited during startup")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server.py did not start")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the HTTP service rejects malformed requests with 400.")
+    parser.add_argument("--port", type=int, default=None, help="port to start the server on (default: a free one)")
+    args = parser.parse_args(argv)
+
+    port = args.port or free_port()
+    process = subprocess.Popen([sys.executable, SERVER, "--port", str(port), "--jobs", "1"],
+                               stderr=subprocess.DEVNULL)
+    failures = []
+    try:
+        wait_until_ready(port, process)
+        for body in MALFORMED:
+            status, content = post(port, body)
+            if status != 400 or "error" not in json.loads(content or b"{}"):
+                failures.append(f"{body.decode()}: {status} {content[:200]!r}")
+        status, content = post(port, VALID)
+        if status != 200 or not content.startswith(b"MThd"):
+            failures.append(f"{VALID.decode()}: {status} {content[:200]!r}")
+    finally:
+        process.terminate()
+        process.wait()
+
+    if failures:
+        print(f"FAILED: {len(failures)} request(s) not handled as expected:")
+        for line in failures:
+            print("  " + line)
+        return 1
+    print(f"{len(MALFORMED)} malformed requests rejected with 400, valid request served")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
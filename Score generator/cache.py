@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from export import output_path_for
+
+# Content-addressed cache of finished output files.
+#
+# A song is identified by a hash of everything that determines its bytes:
+# genre, generator VERSION, seed, title, composer, format and the remaining
+# generate_song() options (key, measures, exporter, compression, and the
+# melody model, by a hash of its contents).
+# Entries live as <hash>.<format> in one directory, are written atomically
+# (temporary file + os.replace) and are evicted least recently used first
+# once the directory grows past max_bytes (down to EVICT_TO of it, so a full
+# cache is not rescanned on every write); a hit refreshes the entry's mtime.
+# The directory is only rescanned when this process's running total says it
+# is over the limit, or every RESCAN_PUTS writes to pick up other processes'
+# entries, so the limit is approximate when several processes share a cache.
+# Serving a hit only copies a file, so it never imports music21.
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+TEMP_PREFIX = ".tmp-"
+RESCAN_PUTS = 256
+EVICT_TO = 0.9
+
+class OutputCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = None
+        self.puts_since_scan = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(**fields):
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path_for(self, key, output_format):
+        return os.path.join(self.directory, f"{key}.{output_format}")
+
+    def get(self, key, output_format):
+        # Returns the cached file's path, or None on a miss.
+        path = self.path_for(key, output_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key, output_format, write):
+        # write(path) produces the file; it only becomes visible once complete.
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix="." + output_format, dir=self.directory)
+        os.close(fd)
+        try:
+            write(temp_path)
+            os.replace(temp_path, self.path_for(key, output_format))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        path = self.path_for(key, output_format)
+        if self.size is not None:
+            self.size += os.path.getsize(path)
+        self.puts_since_scan += 1
+        if self.size is None or self.size > self.max_bytes or self.puts_since_scan >= RESCAN_PUTS:
+            self.evict(keep=path)
+        return path
+
+    def entries(self):
+        # (mtime, size, path) of every complete entry, oldest first.
+        found = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(TEMP_PREFIX) or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+        found.sort()
+        return found
+
+    def evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TO
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self.size = total
+        self.puts_since_scan = 0
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries)
+        }
+
+    def generate_song(self, generator, genre, title, composer, seed, output=None, output_dir=".",
+                      output_format="mxl", profiler=None, **options):
+        # Like generator.generate_song(), but served from the cache when this
+        # exact song was made before. Returns (path, hit).
+        if output is None:
+            output = output_path_for(title, output_dir, output_format)
+        if seed is None:
+            return generator.generate_song(title, composer, output=output, output_format=output_format,
+                                           profiler=profiler, **options), False
+
+        fields = dict(options)
+        if fields.get("melody_model") is not None:
+            from markov import model_digest
+            # Keyed by the model's contents, so retraining into the same file is a miss.
+            fields["melody_model"] = model_digest(fields["melody_model"])
+        key = self.key(genre=genre, version=generator.version, seed=seed, title=title, composer=composer,
+                       format=output_format, **fields)
+        cached = self.get(key, output_format)
+        hit = cached is not None
+        if not hit:
+            cached = self.put(key, output_format, lambda path: generator.generate_song(
+                title, composer, seed=seed, output=path, output_format=output_format, profiler=profiler, **options))
+        shutil.copyfile(cached, output)
+        return output, hit
@@ -1,268 +1,128 @@
-import zipfile
-import os
 import random
-from music21 import stream, note, metadata, instrument, clef, key, duration, chord, pitch
-
-def create_measure(notes_list, measure_number, current_key):
-    m = stream.Measure(number=measure_number)
-    for note_or_chord, dur, accidental_type in notes_list:
-        if note_or_chord == "rest":
-            r = note.Rest()
-            r.duration = duration.Duration(dur)
-            m.append(r)
-        elif isinstance(note_or_chord, str):
-            n = note.Note(note_or_chord)
-            n.duration = duration.Duration(dur)
-            if accidental_type:
-                n.pitch.accidental = pitch.Accidental(accidental_type.lower())
-            m.append(n)
-        elif isinstance(note_or_chord, list):
-            chord_notes = []
-            for pitch_name in note_or_chord:
-                n = note.Note(pitch_name)
-                chord_notes.append(n)
-            c = chord.Chord(chord_notes)
-            c.duration = duration.Duration(dur)
-            m.append(c)
-    return m
-
-def transpose(note, semitones):
-    note_order = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    flat_note_order = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
-
-    for i, char in enumerate(note):
-        if char.isdigit():
-            note_name = note[:i]
-            octave = int(note[i:])
-            break
+from itertools import islice
+import numpy as np
+from engine import Genre, key_table, register
+from events import NoteEvents, RIGHT_HAND, LEFT_HAND
+from pitches import MAJOR_KEYS, PITCHES, to_key, transpose_diatonic
+from sampler import rng_from_random, sample_scale_degrees
+from streaming import MeasureStream, add_measures
+
+VERSION = 2
+
+SCALE = ["C4", "D4", "E4", "F4", "G4", "A4", "B4"]
+
+# I-V-vi-IV in C major; each key's patterns are this template moved by its key shift.
+BASS_PATTERN = [
+    ["C2", "G2", "C3", "G2"],
+    ["G2", "D3", "G3", "D3"],
+    ["A2", "E3", "A3", "E3"],
+    ["F2", "C3", "F3", "C3"]
+]
+
+def create_bass_pattern(names, selected_key):
+    pitches = [to_key(name, selected_key) for name in names]
+    if pitches[0][0] >= PITCHES["C3"][0]:
+        pitches = [transpose_diatonic(pitch, -12, -7) for pitch in pitches]
+    return [(pitch, 1, None) for pitch in pitches]
+
+SCALES = key_table(tuple(SCALE), tuple(MAJOR_KEYS))
+BASS_PATTERNS = {
+    selected_key: [create_bass_pattern(names, selected_key) for names in BASS_PATTERN]
+    for selected_key in MAJOR_KEYS
+}
+
+# A melody note may not be the 4th scale degree (F4 in C) in measures 1 and 3
+# of each phrase, the 5th (G4) in measures 1 and 2, or the 3rd (E4) in
+# measure 4 (by measure number modulo 4). The rules are by degree, so a
+# melody keeps its degrees in every key.
+MELODY_EXCLUSIONS = [(SCALE.index("F4"), {1, 3}), (SCALE.index("G4"), {1, 2}), (SCALE.index("E4"), {0})]
+
+# Measures of melody sampled per draw by song_events() and measure_stream().
+MELODY_BLOCK = 64
+
+def sample_melodies(rng, keys, measures=16, model=None, context=None):
+    # Scale-degree indices for len(keys) melodies of 4 beats per measure in one
+    # draw: uniform, or from a MarkovMelody continuing from context.
+    measure_numbers = np.arange(1, measures + 1) % 4
+    exclusions = [
+        ([degree] * len(keys), np.isin(measure_numbers, list(phrase_positions)))
+        for degree, phrase_positions in MELODY_EXCLUSIONS
+    ]
+    if model is not None:
+        return model.sample(rng, len(keys), measures, 4, exclusions, context)
+    return sample_scale_degrees(rng, len(keys), measures, 4, len(SCALE), exclusions)
+
+def melody_degrees(selected_key, rng, model=None, block=MELODY_BLOCK):
+    # One melody's degrees, measure by measure, sampled block measures at a
+    # time. A longer song continues the same draws, so it opens with the
+    # same measures as a shorter one.
+    context = None
+    while True:
+        melody = sample_melodies(rng_from_random(rng), [selected_key], block, model, context)
+        if model is not None:
+            context = model.tail(melody)
+        yield from melody[0]
+
+def ending_measures(selected_key):
+    # The closing cadence as (treble, bass) measures.
+    return [
+        ([("rest", 4, None)],
+         [(to_key("F2", selected_key), 1, None), (to_key("C3", selected_key), 1, None), (to_key("F3", selected_key), 2, None)]),
+        ([("rest", 4, None)],
+         [(to_key("G#3", selected_key), 4, None)]),
+        ([([to_key("C4", selected_key), to_key("E4", selected_key), to_key("G4", selected_key), to_key("C5", selected_key)], 4, None)],
+         [([to_key("C2", selected_key), to_key("E2", selected_key), to_key("G2", selected_key), to_key("C3", selected_key)], 4, None)])
+    ]
+
+def create_ending_measures1(selected_key, i, events):
+    return add_measures(events, ending_measures(selected_key), i - 1)
+
+def body_measure(selected_key, i, degrees):
+    # Measure number i as (treble, bass): the melody enters in measure 4.
+    if i < 4:
+        treble_notes = [("rest", 4, None)]
     else:
-        raise ValueError(f"Invalid note format: {note}")
-    if note_name in flat_note_order:
-        note_index = flat_note_order.index(note_name)
-        note_name = note_order[note_index]
-    
-    note_index = note_order.index(note_name)
-    new_index = (note_index + semitones) % 12
-    new_octave = octave + (note_index + semitones) // 12
-    return note_order[new_index] + str(new_octave)
-
-
-def create_ending_measures1(selected_key, i, left_hand, right_hand):
-    key_shifts = {
-        "C": 0, "G": 7, "D": 2, "A": 9, "E": 4, "B": 11,
-        "F#": 6, "C#": 1, "F": 5, "Bb": 10, "Eb": 3, "Ab": 8, "Db": 1, "Gb": 6, "Cb": 11
-    }
-    
-    shift = key_shifts[selected_key]
-    bass_notes = [(transpose("F2", shift), 1, None), (transpose("C3", shift), 1, None), (transpose("F3", shift), 2, None)]
-    measure = create_measure(bass_notes, i, selected_key)
-    left_hand.append(measure)
-    treble_notes = [("rest", 4, None)]
-    measure = create_measure(treble_notes, i, selected_key)
-    right_hand.append(measure)
-    i += 1
-    bass_notes = [(transpose("G#3", shift), 4, None)]
-    measure = create_measure(bass_notes, i, selected_key)
-    left_hand.append(measure)
-    treble_notes = [("rest", 4, None)]
-    measure = create_measure(treble_notes, i, selected_key)
-    right_hand.append(measure)
-    i += 1
-    bass_notes = [([transpose("C2", shift), transpose("E2", shift), transpose("G2", shift), transpose("C3", shift)], 4, None)]
-    treble_notes = [([transpose("C4", shift), transpose("E4", shift), transpose("G4", shift), transpose("C5", shift)], 4, None)]
-    bass_measure = create_measure(bass_notes, i, selected_key)
-    left_hand.append(bass_measure)
-    measure = create_measure(treble_notes, i, selected_key)
-    right_hand.append(measure)
-    return i
-
-def main():
-    major_keys = ["C", "G", "D", "A", "E", "B", "F#", "C#", "F", "Bb", "Eb", "Ab", "Db", "Gb", "Cb"]
-    selected_key = random.choice(major_keys)
-    s = stream.Score()
-
-    s.metadata = metadata.Metadata()
-    s.metadata.title = input("Enter title: ")
-    s.metadata.composer = input("Enter composer: ")
-    
-    right_hand = stream.Part()
-    right_hand.id = "P1"
-    right_hand.insert(0, instrument.Piano())
-    right_hand.insert(0, clef.TrebleClef())
-    right_hand.insert(0, key.Key(selected_key))
+        scale = SCALES[selected_key]
+        treble_notes = [(scale[degree], 1, None) for degree in degrees]
+    return treble_notes, BASS_PATTERNS[selected_key][(i - 1) % 4]
 
-    left_hand = stream.Part()
-    left_hand.id = "P2"
-    left_hand.insert(0, instrument.Piano())
-    left_hand.insert(0, clef.BassClef())
-    left_hand.insert(0, key.Key(selected_key))
+def song_events(selected_key, measures=16, rng=random, model=None, melody=None):
+    if melody is None:
+        melody = list(islice(melody_degrees(selected_key, rng, model), measures))
+    events = NoteEvents()
 
-    measures = 16
     i = 1
 
-    scales = {
-        "C": ["C4", "D4", "E4", "F4", "G4", "A4", "B4"],
-        "G": ["G4", "A4", "B4", "C5", "D5", "E5", "F#5"],
-        "D": ["D4", "E4", "F#4", "G4", "A4", "B4", "C#5"],
-        "A": ["A4", "B4", "C#5", "D5", "E5", "F#5", "G#5"],
-        "E": ["E4", "F#4", "G#4", "A4", "B4", "C#5", "D#5"],
-        "B": ["B4", "C#5", "D#5", "E5", "F#5", "G#5", "A#5"],
-        "F#": ["F#4", "G#4", "A#4", "B4", "C#5", "D#5", "E#5"],
-        "C#": ["C#4", "D#4", "E#4", "F#4", "G#4", "A#4", "B#4"],
-        "F": ["F4", "G4", "A4", "Bb4", "C5", "D5", "E5"],
-        "Bb": ["Bb4", "C5", "D5", "Eb5", "F5", "G5", "A5"],
-        "Eb": ["Eb4", "F4", "G4", "Ab4", "Bb4", "C5", "D5"],
-        "Ab": ["Ab4", "Bb4", "C5", "Db5", "Eb5", "F5", "G5"],
-        "Db": ["Db4", "Eb4", "F4", "Gb4", "Ab4", "Bb4", "C5"],
-        "Gb": ["Gb4", "Ab4", "Bb4", "Cb5", "Db5", "Eb5", "F5"],
-        "Cb": ["Cb4", "Db4", "Eb4", "Fb4", "Gb4", "Ab4", "Bb4"]
-    }
-
-    bass_patterns = {
-        "C": [
-            [("C2", 1, None), ("G2", 1, None), ("C3", 1, None), ("G2", 1, None)],
-            [("G2", 1, None), ("D3", 1, None), ("G3", 1, None), ("D3", 1, None)],
-            [("A2", 1, None), ("E3", 1, None), ("A3", 1, None), ("E3", 1, None)],
-            [("F2", 1, None), ("C3", 1, None), ("F3", 1, None), ("C3", 1, None)]
-        ],
-        "G": [
-            [("G2", 1, None), ("D3", 1, None), ("G3", 1, None), ("D3", 1, None)],
-            [("D2", 1, None), ("A2", 1, None), ("D3", 1, None), ("A2", 1, None)],
-            [("A2", 1, None), ("E3", 1, None), ("A3", 1, None), ("E3", 1, None)],
-            [("C2", 1, None), ("G2", 1, None), ("C3", 1, None), ("G2", 1, None)]
-        ],
-        "D": [
-            [("D2", 1, None), ("A2", 1, None), ("D3", 1, None), ("A2", 1, None)],
-            [("A2", 1, None), ("E3", 1, None), ("A3", 1, None), ("E3", 1, None)],
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)],
-            [("G2", 1, None), ("D3", 1, None), ("G3", 1, None), ("D3", 1, None)]
-        ],
-        "A": [
-            [("A2", 1, None), ("E3", 1, None), ("A3", 1, None), ("E3", 1, None)],
-            [("E2", 1, None), ("B2", 1, None), ("E3", 1, None), ("B2", 1, None)],
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)],
-            [("D2", 1, None), ("A2", 1, None), ("D3", 1, None), ("A2", 1, None)]
-        ],
-        "E": [
-            [("E2", 1, None), ("B2", 1, None), ("E3", 1, None), ("B2", 1, None)],
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)],
-            [("G#2", 1, None), ("D#3", 1, None), ("G#3", 1, None), ("D#3", 1, None)],
-            [("A2", 1, None), ("E3", 1, None), ("A3", 1, None), ("E3", 1, None)]
-        ],
-        "B": [
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)],
-            [("F#2", 1, None), ("C#3", 1, None), ("F#3", 1, None), ("C#3", 1, None)],
-            [("G#2", 1, None), ("D#3", 1, None), ("G#3", 1, None), ("D#3", 1, None)],
-            [("E2", 1, None), ("B2", 1, None), ("E3", 1, None), ("B2", 1, None)]
-        ],
-        "F#": [
-            [("F#2", 1, None), ("C#3", 1, None), ("F#3", 1, None), ("C#3", 1, None)],
-            [("C#2", 1, None), ("G#2", 1, None), ("C#3", 1, None), ("G#2", 1, None)],
-            [("D#2", 1, None), ("A#2", 1, None), ("D#3", 1, None), ("A#2", 1, None)],
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)]
-        ],
-        "C#": [
-            [("C#2", 1, None), ("G#2", 1, None), ("C#3", 1, None), ("G#2", 1, None)],
-            [("G#2", 1, None), ("D#3", 1, None), ("G#3", 1, None), ("D#3", 1, None)],
-            [("A#2", 1, None), ("F3", 1, None), ("A#3", 1, None), ("F3", 1, None)],
-            [("F#2", 1, None), ("C#3", 1, None), ("F#3", 1, None), ("C#3", 1, None)]
-        ],
-        "F": [
-            [("F2", 1, None), ("C3", 1, None), ("F3", 1, None), ("C3", 1, None)],
-            [("C2", 1, None), ("G2", 1, None), ("C3", 1, None), ("G2", 1, None)],
-            [("D2", 1, None), ("A2", 1, None), ("D3", 1, None), ("A2", 1, None)],
-            [("Bb2", 1, None), ("F3", 1, None), ("Bb3", 1, None), ("F3", 1, None)]
-        ],
-        "Bb": [
-            [("Bb2", 1, None), ("F3", 1, None), ("Bb3", 1, None), ("F3", 1, None)],
-            [("F2", 1, None), ("C3", 1, None), ("F3", 1, None), ("C3", 1, None)],
-            [("G2", 1, None), ("D3", 1, None), ("G3", 1, None), ("D3", 1, None)],
-            [("Eb2", 1, None), ("Bb2", 1, None), ("Eb3", 1, None), ("Bb2", 1, None)]
-        ],
-        "Eb": [
-            [("Eb2", 1, None), ("Bb2", 1, None), ("Eb3", 1, None), ("Bb2", 1, None)],
-            [("Bb2", 1, None), ("F3", 1, None), ("Bb3", 1, None), ("F3", 1, None)],
-            [("C2", 1, None), ("G2", 1, None), ("C3", 1, None), ("G2", 1, None)],
-            [("Ab2", 1, None), ("Eb3", 1, None), ("Ab3", 1, None), ("Eb3", 1, None)]
-        ],
-        "Ab": [
-            [("Ab2", 1, None), ("Eb3", 1, None), ("Ab3", 1, None), ("Eb3", 1, None)],
-            [("Eb2", 1, None), ("Bb2", 1, None), ("Eb3", 1, None), ("Bb2", 1, None)],
-            [("F2", 1, None), ("C3", 1, None), ("F3", 1, None), ("C3", 1, None)],
-            [("Db2", 1, None), ("Ab2", 1, None), ("Db3", 1, None), ("Ab2", 1, None)]
-        ],
-        "Db": [
-            [("Db2", 1, None), ("Ab2", 1, None), ("Db3", 1, None), ("Ab2", 1, None)],
-            [("Ab2", 1, None), ("Eb3", 1, None), ("Ab3", 1, None), ("Eb3", 1, None)],
-            [("Bb2", 1, None), ("F3", 1, None), ("Bb3", 1, None), ("F3", 1, None)],
-            [("Gb2", 1, None), ("Db3", 1, None), ("Gb3", 1, None), ("Db3", 1, None)]
-        ],
-        "Gb": [
-            [("Gb2", 1, None), ("Db3", 1, None), ("Gb3", 1, None), ("Db3", 1, None)],
-            [("Db2", 1, None), ("Ab2", 1, None), ("Db3", 1, None), ("Ab2", 1, None)],
-            [("Eb2", 1, None), ("Bb2", 1, None), ("Eb3", 1, None), ("Bb2", 1, None)],
-            [("B2", 1, None), ("F#3", 1, None), ("B3", 1, None), ("F#3", 1, None)]
-        ],
-        "Cb": [
-            [("Cb2", 1, None), ("Gb2", 1, None), ("Cb3", 1, None), ("Gb2", 1, None)],
-            [("Gb2", 1, None), ("Db3", 1, None), ("Gb3", 1, None), ("Db3", 1, None)],
-            [("Ab2", 1, None), ("Eb3", 1, None), ("Ab3", 1, None), ("Eb3", 1, None)],
-            [("E2", 1, None), ("B2", 1, None), ("E3", 1, None), ("B2", 1, None)]
-        ]
-    }
-
     while i <= measures:
-        scale = scales[selected_key]
-        if i < 4 or i > 15:
+        treble_notes, bass_notes = body_measure(selected_key, i, melody[i - 1])
+        if i > measures - 1:
             treble_notes = [("rest", 4, None)]
-        else:
-            treble_notes = [(random.choice(scale), 1, None) for _ in range(4)]
-            treble_notes = [
-                (random.choice([note for note in scale if note != "F4"]), 1, None)
-                if i % 4 in {1, 3} and note == "F4" else
-                (random.choice([note for note in scale if note != "G4"]), 1, None)
-                if i % 4 in {1, 2} and note == "G4" else
-                (random.choice([note for note in scale if note != "E4"]), 1, None)
-                if i % 4 == 0 and note == "E4" else note
-                for note in treble_notes
-            ]
-
-        bass_notes = bass_patterns[selected_key][(i - 1) % 4]
 
-        measure = create_measure(bass_notes, i, selected_key)
-        left_hand.append(measure)
-        measure = create_measure(treble_notes, i, selected_key)
-        right_hand.append(measure)
+        events.add_measure(LEFT_HAND, i - 1, bass_notes)
+        events.add_measure(RIGHT_HAND, i - 1, treble_notes)
         i += 1
     
-    create_ending_measures1(selected_key, i, left_hand, right_hand)
-
-    s.append(right_hand)
-    s.append(left_hand)
-
-    file_name = s.metadata.title.replace(" ", "_")
-    xml_filename = file_name + ".xml"
-    s.write("musicxml", fp=xml_filename)
-
-    container_xml_content = '''<?xml version="1.0" encoding="UTF-8"?>
-    <container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
-       <rootfiles>
-          <rootfile full-path="{}" media-type="application/vnd.recordare.musicxml+xml"/>
-       </rootfiles>
-    </container>'''.format(xml_filename)
-
-    os.makedirs("META-INF", exist_ok=True)
-
-    with open("META-INF/container.xml", "w") as f:
-        f.write(container_xml_content)
-
-    with zipfile.ZipFile(file_name + ".mxl", 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(xml_filename, arcname=xml_filename)
-        zipf.write("META-INF/container.xml", arcname="META-INF/container.xml")
-
-    os.remove(xml_filename)
-    os.remove("META-INF/container.xml")
-    os.rmdir("META-INF")
+    create_ending_measures1(selected_key, i, events)
+    return events
+
+def measure_stream(selected_key, rng=random, model=None, block=MELODY_BLOCK):
+    # block must be a multiple of 4 so that the phrase rules line up.
+    if block % 4:
+        raise ValueError(f"block must be a multiple of 4, got {block}")
+    melody = melody_degrees(selected_key, rng, model, block)
+
+    def body():
+        for i, degrees in enumerate(melody, 1):
+            yield body_measure(selected_key, i, degrees)
+    return MeasureStream(selected_key, body(), ending_measures)
+
+GENRE = register(Genre("classical", VERSION, SCALE, MAJOR_KEYS, song_events, measure_stream,
+                       "Generate a classical piano score.", sample_melodies))
+generate_events = GENRE.generate_events
+stream_measures = GENRE.stream_measures
+generate_many_events = GENRE.generate_many_events
+generate_song = GENRE.generate_song
+main = GENRE.main
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,121 @@
+import argparse
+import importlib
+import random
+import zipfile
+from functools import lru_cache
+from export import FORMATS, export_song, output_path_for
+from markov import melody_model_for
+from pitches import to_key
+from profiling import add_profile_arguments, profile_run, stage
+
+# Shared generation core and genre registry.
+#
+# A genre supplies only what makes it a genre: its scale, its keys and how
+# it turns a key and a random stream into note events (song_events) or a
+# MeasureStream (measure_stream). Genre wraps those in the pipeline every
+# genre shares: key selection, seeding, the melody model, the output path,
+# the exporters and profiling, and the command line of the genre scripts.
+# Genre modules register() their Genre on import; get_genre() imports a
+# listed module on first use, so one process can serve every genre from a
+# single import each, and a new genre module (added to GENRE_MODULES) gets
+# every export path, batch.py, the worker and the server without further
+# changes.
+
+GENRE_MODULES = ["classical", "jazz", "moody"]
+
+REGISTRY = {}
+
+class Genre:
+    def __init__(self, name, version, scale, keys, song_events, measure_stream, description, sample_melodies=None):
+        # version: bump when a change alters the output for a given seed; it
+        # is part of the cache and recipe keys.
+        # song_events(selected_key, measures=, rng=, model=, **options) -> NoteEvents
+        # measure_stream(selected_key, rng=, model=, **options) -> MeasureStream
+        # sample_melodies(numpy_rng, keys, measures, model) -> one melody per
+        # key, for genres whose song_events also accept melody=.
+        self.name = name
+        self.version = version
+        self.scale = scale
+        self.keys = keys
+        self.song_events = song_events
+        self.measure_stream = measure_stream
+        self.description = description
+        self.sample_melodies = sample_melodies
+
+    def draw_key(self, rng=random):
+        return rng.choice(self.keys)
+
+    def pick_key(self, rng=random, selected_key=None):
+        # The key is drawn even when it is given, so fixing it (as a recipe
+        # does) leaves the rest of the random stream unchanged.
+        drawn_key = self.draw_key(rng)
+        return selected_key or drawn_key
+
+    def generate_events(self, selected_key=None, measures=16, rng=random, model=None, **options):
+        # (key, NoteEvents) for a whole song.
+        selected_key = self.pick_key(rng, selected_key)
+        return selected_key, self.song_events(selected_key, measures=measures, rng=rng, model=model, **options)
+
+    def stream_measures(self, selected_key=None, rng=random, model=None, **options):
+        # An endless MeasureStream in the picked key.
+        selected_key = self.pick_key(rng, selected_key)
+        return self.measure_stream(selected_key, rng=rng, model=model, **options)
+
+    def generate_many_events(self, count, rng, measures=16, model=None):
+        # Picks keys and samples every melody in one vectorized call; rng is a
+        # NumPy Generator.
+        if self.sample_melodies is None:
+            raise ValueError(f"The {self.name} genre does not sample its melodies ahead")
+        keys = [self.keys[k] for k in rng.integers(0, len(self.keys), size=count)]
+        melodies = self.sample_melodies(rng, keys, measures, model)
+        return [(selected_key, self.song_events(selected_key, measures=measures, melody=melody))
+                for selected_key, melody in zip(keys, melodies)]
+
+    def generate_song(self, title, composer, seed=None, output_dir=".", exporter="fast",
+                      compression=zipfile.ZIP_DEFLATED, compresslevel=None, output=None, profiler=None,
+                      output_format="mxl", selected_key=None, measures=16, melody_model=None):
+        rng = random.Random(seed)
+        model = melody_model_for(melody_model, self.scale)
+
+        with stage(profiler, "generation"):
+            selected_key, events = self.generate_events(selected_key, measures=measures, rng=rng, model=model)
+        if output is None:
+            output = output_path_for(title, output_dir, output_format)
+        return export_song(events, title, composer, selected_key, output, output_format, exporter, compression,
+                           compresslevel, profiler)
+
+    def main(self, argv=None):
+        parser = argparse.ArgumentParser(description=self.description)
+        parser.add_argument("--format", choices=FORMATS, default="mxl", help="write a MusicXML (.mxl), MIDI (.mid) or WAV audio file")
+        parser.add_argument("--measures", type=int, default=16, help="number of measures before the ending")
+        parser.add_argument("--melody-model", help="draw the melody from an n-gram model trained by markov.py (.npy)")
+        add_profile_arguments(parser)
+        args = parser.parse_args(argv)
+
+        title = input("Enter title: ")
+        composer = input("Enter composer: ")
+        with profile_run(args, genre=self.name, title=title) as profiler:
+            self.generate_song(title, composer, profiler=profiler, output_format=args.format, measures=args.measures,
+                               melody_model=args.melody_model)
+
+def register(genre):
+    REGISTRY[genre.name] = genre
+    return genre
+
+def get_genre(name):
+    if name not in REGISTRY and name in GENRE_MODULES:
+        importlib.import_module(name)
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Unknown genre {name!r}; expected one of {', '.join(GENRE_MODULES)}") from None
+
+def load_genres():
+    # Every listed genre, imported and registered.
+    return {name: get_genre(name) for name in GENRE_MODULES}
+
+@lru_cache(maxsize=None)
+def key_table(names, keys):
+    # {key: [pitch of each name in that key]} for a tuple of names written in
+    # C major / A minor; built once per (names, keys) and shared by every caller.
+    return {selected_key: [to_key(name, selected_key) for name in names] for selected_key in keys}
@@ -0,0 +1,270 @@
+import argparse
+import io
+import os
+import random
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from engine import get_genre
+from events import NoteEvents
+from export import FORMATS, export_song, output_path_for
+from musicxml import SCORE_END, write_header, write_part
+from mxl import file_name_for, write_zip
+from pitches import to_key, transpose
+from profiling import add_profile_arguments, profile_run, stage
+from rhythm import RhythmTable
+
+# Ensemble scores: one part per instrument instead of two piano staves.
+#
+# The parts of an ensemble only share the key and the harmonic plan (one
+# chord per measure, cycling through the genre's progression), so each part
+# is generated on its own by its strategy, from its own seed drawn from the
+# song's, and they can run in parallel worker processes. The parts come back
+# as NoteEvents in their own voice and are merged into one score, which goes
+# through the usual exporters (music21, MIDI or WAV). For the default fast
+# MusicXML export each worker also writes its part's <part> element, so the
+# parent only concatenates and zips and the serial share of the work stays
+# small however many parts there are.
+
+# Chord tones (letters in C major / A minor) per measure, and the final chord.
+PROGRESSIONS = {
+    "classical": [["C", "E", "G"], ["G", "B", "D"], ["A", "C", "E"], ["F", "A", "C"]],
+    "jazz": [["D", "F", "A", "C"], ["C", "Eb", "G", "Bb"]],
+    "moody": [["A", "C", "E"], ["F", "A", "C"], ["D", "F", "A"], ["E", "G", "B"]]
+}
+FINAL_CHORDS = {
+    "classical": ["C", "E", "G"],
+    "jazz": ["D", "F", "A", "C"],
+    "moody": ["A", "C", "E"]
+}
+
+# (name, abbreviation, General MIDI program from 1, strategy, octave, clef)
+ENSEMBLES = {
+    "string_quintet": [
+        ("Violin I", "Vln. I", 41, "melody", 5, ("G", 2)),
+        ("Violin II", "Vln. II", 41, "counter", 4, ("G", 2)),
+        ("Viola", "Vla.", 42, "pad", 4, ("C", 3)),
+        ("Cello", "Vc.", 43, "arpeggio", 3, ("F", 4)),
+        ("Contrabass", "Cb.", 44, "bass", 2, ("F", 4))
+    ],
+    "jazz_combo": [
+        ("Trumpet", "Tpt.", 57, "melody", 4, ("G", 2)),
+        ("Tenor Saxophone", "T. Sax.", 67, "counter", 4, ("G", 2)),
+        ("Piano", "Pno", 1, "comp", 4, ("G", 2)),
+        ("Guitar", "Gtr.", 27, "arpeggio", 3, ("G", 2)),
+        ("Bass", "Bass", 33, "walking_bass", 2, ("F", 4))
+    ]
+}
+
+MELODY_RHYTHMS = RhythmTable([2.0, 1.0, 0.5], [1, 3, 2])
+
+def tone(letter, octave, selected_key):
+    return to_key(f"{letter}{octave}", selected_key)
+
+def harmonic_plan(genre, measures):
+    progression = PROGRESSIONS[genre]
+    return [progression[i % len(progression)] for i in range(measures)]
+
+def scale_in_octave(scale, octave, selected_key):
+    # The genre's scale (written from octave 4) moved to start in octave.
+    return [to_key(name[:-1] + str(int(name[-1]) + octave - 4), selected_key) for name in scale]
+
+# Part strategies: (octave, selected_key, plan, scale, rng) -> the part's
+# measures as the generators' (note_or_chord, duration, accidental) lists.
+
+def melody(octave, selected_key, plan, scale, rng):
+    # A mostly stepwise line over the scale that starts each measure on a chord tone.
+    pool = scale_in_octave(scale, octave, selected_key)
+    position = len(pool) // 2
+    measures = []
+    for chord in plan:
+        chord_classes = {tone(letter, 4, selected_key)[0] % 12 for letter in chord}
+        landing = [i for i, pitch in enumerate(pool) if pitch[0] % 12 in chord_classes]
+        if landing:
+            position = min(landing, key=lambda i: abs(i - position))
+        notes = []
+        for dur in MELODY_RHYTHMS.sample(rng):
+            notes.append((pool[position], dur, None))
+            position = min(max(position + rng.choice([-2, -1, -1, 1, 1, 2]), 0), len(pool) - 1)
+        measures.append(notes)
+    return measures
+
+def counter(octave, selected_key, plan, scale, rng):
+    # Two half notes on the upper chord tones.
+    measures = []
+    for chord in plan:
+        upper = chord[1:]
+        first = rng.choice(upper)
+        second = rng.choice([letter for letter in upper if letter != first] or upper)
+        measures.append([(tone(first, octave, selected_key), 2, None), (tone(second, octave, selected_key), 2, None)])
+    return measures
+
+def pad(octave, selected_key, plan, scale, rng):
+    # One chord tone held for the whole measure.
+    return [[(tone(rng.choice(chord[1:]), octave, selected_key), 4, None)] for chord in plan]
+
+def arpeggio(octave, selected_key, plan, scale, rng):
+    # The chord broken into eighth notes, rising from the root.
+    measures = []
+    for chord in plan:
+        tones = [tone(letter, octave, selected_key) for letter in chord]
+        tones = [pitch if pitch[0] >= tones[0][0] else (pitch[0] + 12, pitch[1]) for pitch in tones]
+        start = rng.randrange(len(tones)) if rng.random() < 0.25 else 0
+        measures.append([(tones[(start + i) % len(tones)], 0.5, None) for i in range(8)])
+    return measures
+
+def bass(octave, selected_key, plan, scale, rng):
+    # Root and fifth (or third) in half notes.
+    return [[(tone(chord[0], octave, selected_key), 2, None), (tone(rng.choice(chord[1:3]), octave, selected_key), 2, None)]
+            for chord in plan]
+
+def walking_bass(octave, selected_key, plan, scale, rng):
+    # Quarter notes: root, two chord tones, then a half step below the next root.
+    measures = []
+    for i, chord in enumerate(plan):
+        next_root = tone(plan[(i + 1) % len(plan)][0], octave, selected_key)
+        measures.append([
+            (tone(chord[0], octave, selected_key), 1, None),
+            (tone(rng.choice(chord[1:]), octave, selected_key), 1, None),
+            (tone(rng.choice(chord), octave, selected_key), 1, None),
+            (transpose(next_root, -1), 1, None)
+        ])
+    return measures
+
+def comp(octave, selected_key, plan, scale, rng):
+    # The chord on beats 2 and 4.
+    measures = []
+    for chord in plan:
+        voicing = [tone(letter, octave, selected_key) for letter in chord]
+        measures.append([("rest", 1, None), (voicing, 1, None), ("rest", 1, None), (voicing, 1, None)])
+    return measures
+
+STRATEGIES = {
+    "melody": melody,
+    "counter": counter,
+    "pad": pad,
+    "arpeggio": arpeggio,
+    "bass": bass,
+    "walking_bass": walking_bass,
+    "comp": comp
+}
+
+def ensemble_parts(ensemble, count=None):
+    # The ensemble's part specs; count cycles through them, numbering repeats (Violin I 2, ...).
+    specs = ENSEMBLES[ensemble]
+    if count is None:
+        return list(specs)
+    parts = []
+    for i in range(count):
+        name, abbreviation, *rest = specs[i % len(specs)]
+        desk = i // len(specs)
+        if desk:
+            name, abbreviation = f"{name} {desk + 1}", f"{abbreviation} {desk + 1}"
+        parts.append((name, abbreviation, *rest))
+    return parts
+
+def midi_channel(voice):
+    # Channels 1-16 from MusicXML's count, skipping 10 (percussion).
+    channel = voice % 15
+    return channel + 1 if channel < 9 else channel + 2
+
+def score_parts(specs):
+    # musicxml.PARTS entries for the part specs, one voice each.
+    return [(voice, f"P{voice + 1}", part_clef, midi_channel(voice), name, abbreviation, program)
+            for voice, (name, abbreviation, program, _, _, part_clef) in enumerate(specs)]
+
+def generate_part(job):
+    # Runs in a worker process: one part, in voice `voice` of its own
+    # NoteEvents, or with render its MusicXML <part> element as text.
+    genre, strategy, octave, part_clef, selected_key, measures, voice, seed, render = job
+    rng = random.Random(seed)
+    scale = get_genre(genre).scale
+    plan = harmonic_plan(genre, measures)
+    events = NoteEvents()
+    for i, notes in enumerate(STRATEGIES[strategy](octave, selected_key, plan, scale, rng)):
+        events.add_measure(voice, i, notes)
+    final = FINAL_CHORDS[genre]
+    letter = final[0] if octave <= 3 else final[voice % len(final)]
+    events.add_measure(voice, measures, [(tone(letter, octave, selected_key), 4, None)])
+    if not render:
+        return events
+    out = io.StringIO()
+    write_part(out, events, voice, f"P{voice + 1}", part_clef, selected_key)
+    return out.getvalue()
+
+def run_parts(genre, ensemble, selected_key=None, measures=16, seed=None, count=None, executor=None, render=False):
+    # (selected_key, generate_part() results in part order, musicxml.PARTS-style
+    # parts). Parts are mapped over executor when one is given, else
+    # generated in this process; either way the result is the same.
+    rng = random.Random(seed)
+    selected_key = get_genre(genre).pick_key(rng, selected_key)
+    specs = ensemble_parts(ensemble, count)
+    jobs = [(genre, strategy, octave, part_clef, selected_key, measures, voice, rng.getrandbits(64), render)
+            for voice, (_, _, _, strategy, octave, part_clef) in enumerate(specs)]
+    results = list(executor.map(generate_part, jobs) if executor else map(generate_part, jobs))
+    return selected_key, results, score_parts(specs)
+
+def generate_ensemble(genre, ensemble, selected_key=None, measures=16, seed=None, count=None, executor=None):
+    # (selected_key, merged NoteEvents, musicxml.PARTS-style parts).
+    selected_key, results, parts = run_parts(genre, ensemble, selected_key, measures, seed, count, executor)
+    events = NoteEvents()
+    for part in results:
+        events.extend(part)
+    return selected_key, events, parts
+
+def write_ensemble_mxl(part_texts, title, composer, parts, target, compression=zipfile.ZIP_DEFLATED,
+                       compresslevel=None):
+    out = io.StringIO()
+    write_header(out, title, composer, parts)
+    out.writelines(part_texts)
+    out.write(SCORE_END)
+    write_zip(file_name_for(title) + ".xml", out.getvalue().encode("utf-8"), target, compression, compresslevel)
+    return target
+
+def generate_song(title, composer, genre, ensemble, seed=None, output_dir=".", exporter="fast",
+                  compression=zipfile.ZIP_DEFLATED, compresslevel=None, output=None, profiler=None,
+                  output_format="mxl", selected_key=None, measures=16, count=None, workers=1):
+    # workers > 1 generates the parts in that many processes.
+    workers = min(workers or os.cpu_count() or 1, count or len(ENSEMBLES[ensemble]))
+    render = output_format == "mxl" and exporter == "fast"
+    with stage(profiler, "generation"):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                selected_key, results, parts = run_parts(genre, ensemble, selected_key, measures, seed, count,
+                                                         executor, render)
+        else:
+            selected_key, results, parts = run_parts(genre, ensemble, selected_key, measures, seed, count,
+                                                     render=render)
+    if output is None:
+        output = output_path_for(title, output_dir, output_format)
+    if render:
+        with stage(profiler, "zip"):
+            return write_ensemble_mxl(results, title, composer, parts, output, compression, compresslevel)
+    events = NoteEvents()
+    for part in results:
+        events.extend(part)
+    return export_song(events, title, composer, selected_key, output, output_format, exporter, compression,
+                       compresslevel, profiler, parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate an ensemble score with one part per instrument.")
+    parser.add_argument("--genre", choices=sorted(PROGRESSIONS), required=True, help="key, scale and chords")
+    parser.add_argument("--ensemble", choices=sorted(ENSEMBLES), default="string_quintet")
+    parser.add_argument("--parts", type=int, default=None,
+                        help="number of parts, cycling through the ensemble's instruments (default: one each)")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes generating parts (0: CPU count)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=FORMATS, default="mxl", help="write a MusicXML (.mxl), MIDI (.mid) or WAV audio file")
+    parser.add_argument("--measures", type=int, default=16, help="number of measures before the ending")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.parts is not None and not 1 <= args.parts <= 255:
+        parser.error("--parts must be between 1 and 255")
+
+    title = input("Enter title: ")
+    composer = input("Enter composer: ")
+    with profile_run(args, genre=args.genre, ensemble=args.ensemble, title=title) as profiler:
+        generate_song(title, composer, args.genre, args.ensemble, seed=args.seed, profiler=profiler,
+                      output_format=args.format, measures=args.measures, count=args.parts, workers=args.jobs)
+
+if __name__ == "__main__":
+    main()
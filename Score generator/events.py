@@ -0,0 +1,177 @@
+from array import array
+from functools import lru_cache
+from pitches import parse_pitch, step_and_octave
+
+# Compact note-event representation shared by all genres.
+#
+# Each note is one row across parallel typed arrays: MIDI pitch, spelling
+# alteration, onset and duration in quarter lengths, and voice (hand).
+# Chords are consecutive rows with the same voice and onset, rests use
+# pitch REST. A row costs 20 bytes, so a 4/4 measure of four quarter notes
+# is ~80 bytes against ~10 KB for the equivalent music21 Measure, Notes and
+# Durations (tracemalloc, music21 10.x, CPython 3.11). music21 objects are
+# only built (and music21 only imported) by to_score() when a music21
+# export is requested.
+
+REST = -1
+RIGHT_HAND = 0
+LEFT_HAND = 1
+MEASURE_LENGTH = 4.0
+
+MUSIC21_ACCIDENTALS = {-2: "--", -1: "-", 0: "", 1: "#", 2: "##"}
+
+def music21_name(midi, alter=0):
+    step, octave = step_and_octave(midi, alter)
+    return step + MUSIC21_ACCIDENTALS[alter] + str(octave)
+
+def as_pitch(pitch):
+    return parse_pitch(pitch) if isinstance(pitch, str) else pitch
+
+class NoteEvents:
+    __slots__ = ("pitch", "alter", "onset", "duration", "voice")
+
+    def __init__(self):
+        self.pitch = array("h")
+        self.alter = array("b")
+        self.onset = array("d")
+        self.duration = array("d")
+        self.voice = array("B")
+
+    def __len__(self):
+        return len(self.pitch)
+
+    def extend(self, other):
+        # Appends every row of another NoteEvents, e.g. a separately generated part.
+        self.pitch.extend(other.pitch)
+        self.alter.extend(other.alter)
+        self.onset.extend(other.onset)
+        self.duration.extend(other.duration)
+        self.voice.extend(other.voice)
+
+    def add(self, voice, onset, midi, dur, alter=0):
+        self.pitch.append(midi)
+        self.alter.append(alter)
+        self.onset.append(onset)
+        self.duration.append(dur)
+        self.voice.append(voice)
+
+    def add_measure(self, voice, measure_index, notes_list):
+        # notes_list uses the generators' (note_or_chord, duration, accidental) tuples,
+        # where a note is a (midi, alter) pitch or a pitch name and a chord is a list of them.
+        onset = measure_index * MEASURE_LENGTH
+        for note_or_chord, dur, _ in notes_list:
+            if note_or_chord == "rest":
+                self.add(voice, onset, REST, dur)
+            elif isinstance(note_or_chord, list):
+                for pitch in note_or_chord:
+                    midi, alter = as_pitch(pitch)
+                    self.add(voice, onset, midi, dur, alter)
+            else:
+                midi, alter = as_pitch(note_or_chord)
+                self.add(voice, onset, midi, dur, alter)
+            onset += dur
+
+    def measure_count(self):
+        if not self.onset:
+            return 0
+        return int(max(self.onset) // MEASURE_LENGTH) + 1
+
+    def iter_voice(self, voice):
+        # Yields (measure_index, [(midi, alter), ...], duration); an empty pitch list is a rest.
+        rows = [i for i, v in enumerate(self.voice) if v == voice]
+        rows.sort(key=self.onset.__getitem__)
+        current = None
+        for i in rows:
+            onset = self.onset[i]
+            if current is not None and current[0] == onset:
+                current[1].append((self.pitch[i], self.alter[i]))
+                continue
+            if current is not None:
+                yield int(current[0] // MEASURE_LENGTH), current[1], current[2]
+            pitches = [] if self.pitch[i] == REST else [(self.pitch[i], self.alter[i])]
+            current = (onset, pitches, self.duration[i])
+        if current is not None:
+            yield int(current[0] // MEASURE_LENGTH), current[1], current[2]
+
+# Measure templates for the music21 path.
+#
+# A piece repeats a handful of distinct measures many times (the same bass
+# bar every measure, alternating chords, whole-bar rests), so the music21
+# pitch names, offsets and durations of each distinct measure are worked out
+# once and kept in an LRU cache; create_measure() then only instantiates the
+# objects. Each use still gets its own Note, Pitch and Duration objects:
+# music21's exporter writes accidental display state onto them, so sharing
+# (or shallow-copying) them across measures would leak between bars, and
+# copy.deepcopy() of a built measure is several times slower than building it.
+MEASURE_TEMPLATES = 4096
+
+@lru_cache(maxsize=MEASURE_TEMPLATES)
+def measure_template(measure_events):
+    # ((offset, ((step, octave, alter), ...), duration), ...) for ((pitches, duration), ...).
+    template = []
+    offset = 0.0
+    for pitches, dur in measure_events:
+        template.append((offset, tuple((*step_and_octave(midi, alter), alter) for midi, alter in pitches), dur))
+        offset += dur
+    return tuple(template)
+
+def measure_template_stats():
+    info = measure_template.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else None,
+        "templates": info.currsize
+    }
+
+def create_measure(events, measure_number):
+    # events: [(pitches, duration), ...] as collected by create_part().
+    from music21 import stream, note, chord, pitch
+    m = stream.Measure(number=measure_number)
+    for offset, spellings, dur in measure_template(tuple((tuple(pitches), dur) for pitches, dur in events)):
+        # Building Pitches from step and octave skips music21's name parsing.
+        pitches = [pitch.Pitch(step=step, octave=octave, accidental=alter or None) for step, octave, alter in spellings]
+        if not pitches:
+            n = note.Rest(quarterLength=dur)
+        elif len(pitches) == 1:
+            n = note.Note(pitches[0], quarterLength=dur)
+        else:
+            n = chord.Chord(pitches, quarterLength=dur)
+        m.coreInsert(offset, n)
+    m.coreElementsChanged()
+    return m
+
+def create_part(events, voice, part_id, part_clef, selected_key, part_instrument=None):
+    from music21 import stream, instrument, key
+    part = stream.Part()
+    part.id = part_id
+    part.insert(0, part_instrument or instrument.Piano())
+    part.insert(0, part_clef)
+    part.insert(0, key.Key(selected_key))
+
+    measures = [[] for _ in range(events.measure_count())]
+    for measure_index, pitches, dur in events.iter_voice(voice):
+        measures[measure_index].append((pitches, dur))
+    for measure_index, measure_events in enumerate(measures):
+        if measure_events:
+            part.append(create_measure(measure_events, measure_index + 1))
+    return part
+
+def to_score(events, title, composer, selected_key, parts=None):
+    # parts (as in musicxml.PARTS) replace the two piano staves.
+    from music21 import stream, metadata, clef, instrument
+    s = stream.Score()
+    s.metadata = metadata.Metadata()
+    s.metadata.title = title
+    s.metadata.composer = composer
+    if parts is None:
+        s.append(create_part(events, RIGHT_HAND, "P1", clef.TrebleClef(), selected_key))
+        s.append(create_part(events, LEFT_HAND, "P2", clef.BassClef(), selected_key))
+        return s
+    for voice, part_id, (sign, line), _, name, _, program in parts:
+        part_instrument = instrument.instrumentFromMidiProgram(program - 1)
+        part_instrument.partName = name
+        s.append(create_part(events, voice, part_id, clef.clefFromString(f"{sign}{line}"), selected_key,
+                             part_instrument))
+    return s
@@ -0,0 +1,24 @@
+import zipfile
+from audio import export_wav, wav_path_for
+from midi import export_midi, midi_path_for
+from mxl import export_events, mxl_path_for
+
+# Output formats shared by the genre scripts, batch.py and worker.py.
+
+FORMATS = ["mxl", "midi", "wav"]
+
+PATHS = {"mxl": mxl_path_for, "midi": midi_path_for, "wav": wav_path_for}
+EXTENSIONS = {"mxl": ".mxl", "midi": ".mid", "wav": ".wav"}
+
+def output_path_for(title, output_dir=".", output_format="mxl"):
+    return PATHS[output_format](title, output_dir)
+
+def export_song(events, title, composer, selected_key, target, output_format="mxl", exporter="fast",
+                compression=zipfile.ZIP_DEFLATED, compresslevel=None, profiler=None, parts=None):
+    # parts (as in musicxml.PARTS) replace the two piano staves, e.g. for an ensemble.
+    if output_format == "midi":
+        return export_midi(events, title, composer, selected_key, target, profiler, parts)
+    if output_format == "wav":
+        return export_wav(events, target, profiler)
+    return export_events(events, title, composer, selected_key, target, exporter, compression, compresslevel,
+                         profiler, parts)
@@ -1,145 +1,90 @@
-import zipfile
-import os
 import random
-from music21 import stream, note, metadata, instrument, clef, key, duration, chord, pitch
+from engine import Genre, key_table, register
+from events import NoteEvents, RIGHT_HAND, LEFT_HAND
+from pitches import MAJOR_KEYS, to_key
+from rhythm import RhythmTable
+from sampler import rng_from_random
+from streaming import MeasureStream, add_measures
 
-def create_measure(notes_list, measure_number, current_key):
-    m = stream.Measure(number=measure_number)
-    for note_or_chord, dur, accidental_type in notes_list:
-        if note_or_chord == "rest":
-            r = note.Rest()
-            r.duration = duration.Duration(dur)
-            m.append(r)
-        elif isinstance(note_or_chord, str):
-            n = note.Note(note_or_chord)
-            n.duration = duration.Duration(dur)
-            if accidental_type:
-                n.pitch.accidental = pitch.Accidental(accidental_type.lower())
-            m.append(n)
-        elif isinstance(note_or_chord, list):
-            chord_notes = []
-            for pitch_name in note_or_chord:
-                n = note.Note(pitch_name)
-                chord_notes.append(n)
-            c = chord.Chord(chord_notes)
-            c.duration = duration.Duration(dur)
-            m.append(c)
-    return m
+VERSION = 1
 
-def transpose(note, semitones):
-    note_order = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    flat_note_order = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+SCALE = ["C4", "D4", "Eb4", "F4", "G4", "A4", "Bb4", "C5"]
 
-    for i, char in enumerate(note):
-        if char.isdigit():
-            note_name = note[:i]
-            octave = int(note[i:])
-            break
-    else:
-        raise ValueError(f"Invalid note format: {note}")
-    if note_name in flat_note_order:
-        note_index = flat_note_order.index(note_name)
-        note_name = note_order[note_index]
-    
-    note_index = note_order.index(note_name)
-    new_index = (note_index + semitones) % 12
-    new_octave = octave + (note_index + semitones) // 12
-    return note_order[new_index] + str(new_octave)
-
-def main():
-    major_keys = ["C", "G", "D", "A", "E", "B", "F#", "C#", "F", "Bb", "Eb", "Ab", "Db", "Gb", "Cb"]
-    selected_key = random.choice(major_keys)
-    key_shifts = {
-        "C": 0, "G": 7, "D": 2, "A": 9, "E": 4, "B": 11,
-        "F#": 6, "C#": 1, "F": 5, "Bb": 10, "Eb": 3, "Ab": 8, "Db": 1, "Gb": 6, "Cb": 11
-    }
-    shift = key_shifts[selected_key]
-    s = stream.Score()
-
-    s.metadata = metadata.Metadata()
-    s.metadata.title = input("Enter title: ")
-    s.metadata.composer = input("Enter composer: ")
-    
-    right_hand = stream.Part()
-    right_hand.id = "P1"
-    right_hand.insert(0, instrument.Piano())
-    right_hand.insert(0, clef.TrebleClef())
-    right_hand.insert(0, key.Key(selected_key))
+SCALES = key_table(tuple(SCALE), tuple(MAJOR_KEYS))
 
-    left_hand = stream.Part()
-    left_hand.id = "P2"
-    left_hand.insert(0, instrument.Piano())
-    left_hand.insert(0, clef.BassClef())
-    left_hand.insert(0, key.Key(selected_key))
-
-    measures = 16
-    measure_length = 4.0
-
-    scale = ["C4", "D4", "Eb4", "F4", "G4", "A4", "Bb4", "C5"]
-
-    bass_pattern = [
-        [([transpose("D3", shift), transpose("F3", shift), transpose("A3", shift), transpose("C4", shift)], 4, None)],
-        [([transpose("C3", shift), transpose("Eb3", shift), transpose("G3", shift), transpose("Bb3", shift)], 4, None)]
+# Dm7 and Cm7 (in C), alternating every measure.
+BASS_PATTERNS = {
+    selected_key: [
+        [([to_key("D3", selected_key), to_key("F3", selected_key), to_key("A3", selected_key), to_key("C4", selected_key)], 4, None)],
+        [([to_key("C3", selected_key), to_key("Eb3", selected_key), to_key("G3", selected_key), to_key("Bb3", selected_key)], 4, None)]
     ]
+    for selected_key in MAJOR_KEYS
+}
 
-    durations = [duration.Duration(2.0), duration.Duration(1.0), duration.Duration(0.25)]
+# Half, quarter and sixteenth notes drawn with equal weight, last note cut to fit the bar.
+RHYTHMS = RhythmTable([2.0, 1.0, 0.25])
 
-    def create_right_hand_measure():
-        m = stream.Measure(number=1)
-        total_duration = 0.0
-        
-        while total_duration < measure_length:
-            dur = random.choice(durations)
-            if total_duration + dur.quarterLength > measure_length:
-                dur = duration.Duration(measure_length - total_duration)
-            
-            n = note.Note(transpose(random.choice(scale), shift))
-            n.duration = dur
-            m.append(n)
-            
-            total_duration += dur.quarterLength
-
-        return m
+def ending_measures(selected_key):
+    # The final chords as one (right hand, left hand) measure.
+    return [
+        ([([to_key("F4", selected_key), to_key("A4", selected_key), to_key("C4", selected_key), to_key("E4", selected_key)], 4, None)],
+         [([to_key("D3", selected_key), to_key("F3", selected_key), to_key("A3", selected_key), to_key("C4", selected_key)], 4, None)])
+    ]
 
+def body_measure(selected_key, i, rhythms, rng):
+    scale = SCALES[selected_key]
+    right_hand = [(rng.choice(scale), dur, None) for dur in rhythms.sample(rng)]
+    return right_hand, BASS_PATTERNS[selected_key][i % 2]
+
+def model_measures(selected_key, first_index, count, rhythms, rng, model, context=None):
+    # count measures whose melody comes from a MarkovMelody continuing from
+    # context, plus the context to continue after them.
+    scale = SCALES[selected_key]
+    durations = [rhythms.sample(rng) for _ in range(count)]
+    melody = model.sample(rng_from_random(rng), 1, 1, sum(map(len, durations)), context=context)
+    degrees = iter(melody.ravel())
+    measures = [
+        ([(scale[next(degrees)], dur, None) for dur in rhythm], BASS_PATTERNS[selected_key][(first_index + i) % 2])
+        for i, rhythm in enumerate(durations)
+    ]
+    return measures, model.tail(melody)
 
+def song_events(selected_key, measures=16, rng=random, model=None, rhythms=RHYTHMS):
+    events = NoteEvents()
 
-    for i in range(measures):
-        right_hand.append(create_right_hand_measure())
-        
-        if i % 2 == 0:
-            left_hand.append(create_measure(bass_pattern[0], i, selected_key))
-        else:
-            left_hand.append(create_measure(bass_pattern[1], i, selected_key))
+    if model is not None:
+        add_measures(events, model_measures(selected_key, 0, measures, rhythms, rng, model)[0], 0)
+    else:
+        for i in range(measures):
+            right_hand, left_hand = body_measure(selected_key, i, rhythms, rng)
+            events.add_measure(RIGHT_HAND, i, right_hand)
+            events.add_measure(LEFT_HAND, i, left_hand)
     
-    left_hand.append(create_measure([([transpose("D3", shift), transpose("F3", shift), transpose("A3", shift), transpose("C4", shift)], 4, None)], i, selected_key))    
-    right_hand.append(create_measure([([transpose("F4", shift), transpose("A4", shift), transpose("C4", shift), transpose("E4", shift)], 4, None)], i, selected_key))
-
-    s.append(right_hand)
-    s.append(left_hand)
-
-    file_name = s.metadata.title.replace(" ", "_")
-    xml_filename = file_name + ".xml"
-    s.write("musicxml", fp=xml_filename)
-
-    container_xml_content = '''<?xml version="1.0" encoding="UTF-8"?>
-    <container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
-       <rootfiles>
-          <rootfile full-path="{}" media-type="application/vnd.recordare.musicxml+xml"/>
-       </rootfiles>
-    </container>'''.format(xml_filename)
-
-    os.makedirs("META-INF", exist_ok=True)
-
-    with open("META-INF/container.xml", "w") as f:
-        f.write(container_xml_content)
-
-    with zipfile.ZipFile(file_name + ".mxl", 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(xml_filename, arcname=xml_filename)
-        zipf.write("META-INF/container.xml", arcname="META-INF/container.xml")
-
-    os.remove(xml_filename)
-    os.remove("META-INF/container.xml")
-    os.rmdir("META-INF")
+    add_measures(events, ending_measures(selected_key), measures)
+    return events
+
+def measure_stream(selected_key, rng=random, model=None, rhythms=RHYTHMS, block=64):
+    # Each measure is drawn as it is pulled (block measures at a time with a
+    # melody model).
+    def body():
+        i = 0
+        context = None
+        while True:
+            if model is not None:
+                measures, context = model_measures(selected_key, i, block, rhythms, rng, model, context)
+                yield from measures
+                i += block
+            else:
+                yield body_measure(selected_key, i, rhythms, rng)
+                i += 1
+    return MeasureStream(selected_key, body(), ending_measures)
+
+GENRE = register(Genre("jazz", VERSION, SCALE, MAJOR_KEYS, song_events, measure_stream,
+                       "Generate a jazz piano score."))
+generate_events = GENRE.generate_events
+stream_measures = GENRE.stream_measures
+generate_song = GENRE.generate_song
+main = GENRE.main
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
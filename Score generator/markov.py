@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+from pitches import PITCHES, STEP_PITCH_CLASSES
+from rhythm import alias_tables
+
+# n-gram melody engine trained from a corpus of scores.
+#
+# A model over a genre's scale of S notes and context length `order` is one
+# float64 array of shape (3, S**order, S), saved as .npy and opened with
+# mmap_mode="r" so a worker loads it without reading or parsing anything.
+# Row c of each layer belongs to the context whose last `order` scale
+# degrees, read as base-S digits, make c:
+#   [0] cumulative next-degree probabilities (for an inverse-CDF draw)
+#   [1] alias-method acceptance probabilities
+#   [2] alias-method fallback degrees
+# Sampling is vectorized across songs and steps note by note, each step an
+# O(1) alias draw. Training reads MusicXML (.mxl, .musicxml, .xml) and MIDI
+# (.mid, .midi) files in parallel; each file's melody (its first part or
+# track, top note of each chord) is moved to C major / A minor by its key
+# signature, shifted by octaves into the scale's range and snapped to the
+# nearest scale note.
+
+MUSICXML_EXTENSIONS = (".mxl", ".musicxml", ".xml")
+MIDI_EXTENSIONS = (".mid", ".midi")
+DEFAULT_ORDER = 2
+# Pseudo-count added to every transition, so no continuation is impossible.
+SMOOTHING = 0.1
+# Model files (or versions of one file) kept open per process.
+MODEL_VERSIONS = 16
+
+class MarkovMelody:
+    def __init__(self, tables, sampler="alias"):
+        if tables.ndim != 3 or tables.shape[0] != 3:
+            raise ValueError(f"Expected a (3, contexts, degrees) table, got shape {tables.shape}")
+        self.tables = tables
+        self.scale_size = tables.shape[2]
+        self.order = round(np.log(tables.shape[1]) / np.log(self.scale_size)) if self.scale_size > 1 else 1
+        if self.scale_size ** self.order != tables.shape[1]:
+            raise ValueError(f"{tables.shape[1]} contexts is not a power of {self.scale_size} scale degrees")
+        self.cumulative = tables[0]
+        self.probability = tables[1]
+        self.alias = tables[2].astype(np.intp)
+        self.sampler = sampler
+        self.place = self.scale_size ** (self.order - 1)
+
+    def draw(self, rng, contexts):
+        # One next degree per context.
+        if self.sampler == "cumulative":
+            draws = rng.random(len(contexts))[:, None]
+            return np.minimum((draws >= self.cumulative[contexts]).sum(axis=1), self.scale_size - 1)
+        columns = rng.integers(0, self.scale_size, size=len(contexts))
+        accept = rng.random(len(contexts)) < self.probability[contexts, columns]
+        return np.where(accept, columns, self.alias[contexts, columns])
+
+    def redraw(self, rng, contexts, forbidden):
+        # Draws again for the given contexts with the forbidden (n, S) degrees removed.
+        weights = np.diff(self.cumulative[contexts], axis=1, prepend=0.0)
+        weights[forbidden] = 0.0
+        bounds = np.cumsum(weights, axis=1)
+        draws = rng.random(len(contexts)) * bounds[:, -1]
+        return np.minimum((draws[:, None] >= bounds).sum(axis=1), self.scale_size - 1)
+
+    def sample(self, rng, songs, measures, beats, exclusions=(), context=None):
+        # A songs x measures x beats array of scale degrees, like
+        # sampler.sample_scale_degrees() and with the same exclusions. context
+        # holds each song's previous `order` degrees (e.g. tail() of the last
+        # block); without it the first context is drawn uniformly.
+        if context is None:
+            contexts = rng.integers(0, self.scale_size ** self.order, size=songs)
+        else:
+            contexts = self.context_index(context)
+        song_index = np.arange(songs)
+        rules = [(np.asarray(forbidden), np.asarray(measure_mask, dtype=bool)) for forbidden, measure_mask in exclusions]
+        degrees = np.empty((songs, measures * beats), dtype=np.int8)
+        for step in range(measures * beats):
+            degree = self.draw(rng, contexts)
+            active = [forbidden for forbidden, measure_mask in rules if measure_mask[step // beats]]
+            if active:
+                mask = np.zeros((songs, self.scale_size + 1), dtype=bool)
+                for forbidden in active:
+                    mask[song_index, forbidden] = True
+                mask = mask[:, :self.scale_size]
+                hits = mask[song_index, degree]
+                if hits.any():
+                    degree[hits] = self.redraw(rng, contexts[hits], mask[hits])
+            degrees[:, step] = degree
+            contexts = (contexts % self.place) * self.scale_size + degree
+        return degrees.reshape(songs, measures, beats)
+
+    def context_index(self, context):
+        context = np.asarray(context, dtype=np.intp).reshape(len(context), -1)[:, -self.order:]
+        index = np.zeros(len(context), dtype=np.intp)
+        for column in context.T:
+            index = index * self.scale_size + column
+        return index
+
+    def tail(self, degrees):
+        # The context to continue after a sampled block.
+        return np.asarray(degrees).reshape(len(degrees), -1)[:, -self.order:]
+
+def build_tables(counts, smoothing=SMOOTHING):
+    # counts: (S**order, S) transition counts -> the (3, S**order, S) model array.
+    contexts, scale_size = counts.shape
+    weights = counts.astype(np.float64) + smoothing
+    probabilities = weights / weights.sum(axis=1, keepdims=True)
+
+    tables = np.empty((3, contexts, scale_size), dtype=np.float64)
+    tables[0] = np.cumsum(probabilities, axis=1)
+    tables[0][:, -1] = 1.0
+    for row, p in enumerate(probabilities):
+        tables[1][row], tables[2][row] = alias_tables(list(p * scale_size))
+    return tables
+
+def model_fingerprint(path):
+    # Changes whenever the file at path is rewritten, e.g. by retraining into it.
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_model(path, sampler="alias"):
+    # Memory-mapped, and loaded once per process for each version of the file.
+    return load_model_version(path, model_fingerprint(path), sampler)
+
+@lru_cache(maxsize=MODEL_VERSIONS)
+def load_model_version(path, fingerprint, sampler):
+    return MarkovMelody(np.load(path, mmap_mode="r"), sampler)
+
+@lru_cache(maxsize=MODEL_VERSIONS)
+def model_file_digest(path, fingerprint):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def model_digest(melody_model):
+    # A hash of a model's contents for cache keys: a .npy path, a MarkovMelody or None.
+    if melody_model is None:
+        return None
+    if isinstance(melody_model, str):
+        return model_file_digest(melody_model, model_fingerprint(melody_model))
+    digest = hashlib.sha256(np.ascontiguousarray(melody_model.tables).tobytes())
+    digest.update(melody_model.sampler.encode("utf-8"))
+    return digest.hexdigest()
+
+def melody_model_for(melody_model, scale):
+    # A genre's MarkovMelody from a model, a .npy path, or None.
+    if melody_model is None:
+        return None
+    model = load_model(melody_model) if isinstance(melody_model, str) else melody_model
+    if model.scale_size != len(scale):
+        raise ValueError(f"The melody model has {model.scale_size} scale degrees, but the scale has {len(scale)}")
+    return model
+
+# Corpus reading
+
+def musicxml_root(path):
+    if not path.lower().endswith(".mxl"):
+        return ET.parse(path).getroot()
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        if "META-INF/container.xml" in names:
+            container = ET.fromstring(archive.read("META-INF/container.xml"))
+            score_path = next(element.get("full-path") for element in container.iter() if element.tag.endswith("rootfile"))
+        else:
+            score_path = next(name for name in names if not name.startswith("META-INF/"))
+        return ET.fromstring(archive.read(score_path))
+
+def read_musicxml(path):
+    # (MIDI pitches of the first part's melody, key signature in fifths).
+    root = musicxml_root(path)
+    part = root.find("part")
+    if part is None:
+        raise ValueError(f"{path} has no partwise part")
+    fifths = None
+    melody = []
+    for element in part.iter():
+        if element.tag == "fifths" and fifths is None:
+            fifths = int(element.text)
+        if element.tag != "note" or element.find("rest") is not None or element.find("grace") is not None:
+            continue
+        if element.findtext("voice", "1") != "1" or element.find("pitch") is None:
+            continue
+        pitch = element.find("pitch")
+        midi = ((int(pitch.findtext("octave")) + 1) * 12 + STEP_PITCH_CLASSES[pitch.findtext("step")]
+                + round(float(pitch.findtext("alter", "0"))))
+        if element.find("chord") is not None and melody:
+            melody[-1] = max(melody[-1], midi)
+        else:
+            melody.append(midi)
+    return melody, fifths or 0
+
+def read_midi(path):
+    # (MIDI pitches of the first track with notes, top note of each onset; key signature in fifths).
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError(f"{path} is not a Standard MIDI File")
+    header_length = struct.unpack(">I", data[4:8])[0]
+    position = 8 + header_length
+    fifths = None
+    while position + 8 <= len(data):
+        kind, length = data[position:position + 4], struct.unpack(">I", data[position + 4:position + 8])[0]
+        track = data[position + 8:position + 8 + length]
+        position += 8 + length
+        if kind != b"MTrk":
+            continue
+        notes, track_fifths = read_midi_track(track)
+        if fifths is None:
+            fifths = track_fifths
+        if notes:
+            notes.sort(key=lambda note: (note[0], -note[1]))
+            melody = [pitch for i, (tick, pitch) in enumerate(notes) if i == 0 or notes[i - 1][0] != tick]
+            return melody, fifths or 0
+    return [], fifths or 0
+
+def read_midi_track(track):
+    # ([(tick, pitch) of every note-on outside the drum channel], key signature or None).
+    notes = []
+    fifths = None
+    tick = 0
+    status = 0
+    i = 0
+    while i < len(track):
+        delta = 0
+        while True:
+            byte = track[i]
+            i += 1
+            delta = (delta << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                break
+        tick += delta
+        if track[i] >= 0x80:
+            status = track[i]
+            i += 1
+        if status == 0xFF:
+            kind = track[i]
+            length = 0
+            i += 1
+            while True:
+                byte = track[i]
+                i += 1
+                length = (length << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            if kind == 0x59 and fifths is None:
+                fifths = struct.unpack("b", track[i:i + 1])[0]
+            i += length
+        elif status in (0xF0, 0xF7):
+            length = 0
+            while True:
+                byte = track[i]
+                i += 1
+                length = (length << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            i += length
+        else:
+            message = status & 0xF0
+            size = 1 if message in (0xC0, 0xD0) else 2
+            if message == 0x90 and track[i + 1] > 0 and status & 0x0F != 9:
+                notes.append((tick, track[i]))
+            i += size
+    return notes, fifths
+
+def melody_degrees(melody, fifths, scale_midi):
+    # Snaps a melody onto the scale's indices, as described at the top.
+    melody = np.asarray(melody, dtype=np.int64)
+    # Up a fourth per sharp (down a fifth) and down a fourth per flat, into C major / A minor.
+    shift = (-7 * fifths) % 12
+    if shift > 6:
+        shift -= 12
+    melody = melody + shift
+    low, high = scale_midi[0], scale_midi[-1]
+    melody += 12 * round(((low + high) / 2 - np.median(melody)) / 12)
+    melody = np.where(melody > high, melody - 12 * -(-(melody - high) // 12), melody)
+    melody = np.where(melody < low, melody + 12 * -(-(low - melody) // 12), melody)
+    return np.abs(melody[:, None] - np.asarray(scale_midi)[None, :]).argmin(axis=1)
+
+def count_file(job):
+    # Runs in a worker process: (transition counts, notes) or (None, error) for one file.
+    path, scale_midi, order = job
+    scale_size = len(scale_midi)
+    try:
+        if path.lower().endswith(MIDI_EXTENSIONS):
+            melody, fifths = read_midi(path)
+        else:
+            melody, fifths = read_musicxml(path)
+    except (OSError, ValueError, KeyError, IndexError, StopIteration, TypeError,
+            struct.error, zipfile.BadZipFile, ET.ParseError) as e:
+        return None, f"{path}: {type(e).__name__}: {e}"
+    counts = np.zeros(scale_size ** order * scale_size, dtype=np.int64)
+    if len(melody) > order:
+        degrees = melody_degrees(melody, fifths, scale_midi)
+        contexts = np.zeros(len(degrees) - order, dtype=np.int64)
+        for k in range(order):
+            contexts = contexts * scale_size + degrees[k:len(degrees) - order + k]
+        counts += np.bincount(contexts * scale_size + degrees[order:], minlength=len(counts))
+    return counts.reshape(scale_size ** order, scale_size), len(melody)
+
+def corpus_files(directory):
+    found = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.lower().endswith(MUSICXML_EXTENSIONS + MIDI_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+def train(paths, scale, order=DEFAULT_ORDER, workers=None, smoothing=SMOOTHING):
+    # (model array, files used, notes read, errors) for a list of score files.
+    scale_midi = [PITCHES[name][0] for name in scale]
+    counts = np.zeros((len(scale) ** order, len(scale)), dtype=np.int64)
+    files, notes, errors = 0, 0, []
+    jobs = [(path, scale_midi, order) for path in paths]
+    chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_counts, result in executor.map(count_file, jobs, chunksize=chunksize):
+            if file_counts is None:
+                errors.append(result)
+                continue
+            counts += file_counts
+            files += 1
+            notes += result
+    return build_tables(counts, smoothing), files, notes, errors
+
+def main(argv=None):
+    # Imported here because engine imports this module.
+    from engine import GENRE_MODULES, get_genre
+    parser = argparse.ArgumentParser(description="Train a genre's n-gram melody model from a folder of scores.")
+    parser.add_argument("corpus", help="folder searched for MusicXML (.mxl, .musicxml, .xml) and MIDI (.mid) files")
+    parser.add_argument("--genre", choices=GENRE_MODULES, required=True,
+                        help="whose scale the model is trained over")
+    parser.add_argument("--order", type=int, default=DEFAULT_ORDER, help="notes of context per transition")
+    parser.add_argument("--output", required=True, help="where to save the model (.npy)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--smoothing", type=float, default=SMOOTHING, help="pseudo-count added to every transition")
+    args = parser.parse_args(argv)
+
+    if args.order < 1:
+        parser.error("--order must be at least 1")
+    if args.smoothing <= 0:
+        parser.error("--smoothing must be positive")
+    paths = corpus_files(args.corpus)
+    if not paths:
+        parser.error(f"no MusicXML or MIDI files found in {args.corpus}")
+    start = time.perf_counter()
+    tables, files, notes, errors = train(paths, get_genre(args.genre).scale, args.order,
+                                         args.jobs, args.smoothing)
+    for error in errors:
+        print(f"skipped {error}", file=sys.stderr)
+    np.save(args.output, tables)
+    print(f"Trained an order-{args.order} {args.genre} model on {notes} notes from {files} files "
+          f"in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
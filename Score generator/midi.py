@@ -0,0 +1,120 @@
+import os
+import struct
+import numpy as np
+from events import REST, RIGHT_HAND, LEFT_HAND
+from mxl import file_name_for
+from musicxml import key_signature
+from profiling import stage
+
+# Direct Standard MIDI File writer for generated scores.
+#
+# Writes a format 1 file with one track per hand straight from the note
+# events; the right-hand track also carries the title, composer, tempo, time
+# and key signature. Each track's note-on/note-off messages are built as
+# NumPy columns: tick times are sorted, turned into deltas and variable-length
+# encoded for the whole track at once, so there is no per-note Python loop
+# and no music21.
+
+TICKS_PER_QUARTER = 480
+TEMPO = 500_000  # microseconds per quarter note (120 bpm, music21's default)
+VELOCITY = 80
+
+# (voice, track name, channel, program), channel and program counted from 0.
+TRACKS = [
+    (RIGHT_HAND, "Right Hand", 0, 0),
+    (LEFT_HAND, "Left Hand", 1, 0)
+]
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+def midi_path_for(title, output_dir="."):
+    return os.path.join(output_dir, file_name_for(title) + ".mid")
+
+def variable_length(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+def meta_event(kind, data):
+    return b"\x00\xff" + bytes([kind]) + variable_length(len(data)) + data
+
+def encode_deltas(times):
+    # Variable-length quantities for every delta at once: a (n, 4) byte matrix
+    # most significant group first, with the unused leading groups masked out.
+    deltas = np.diff(times, prepend=0).astype(np.uint32)
+    shifts = np.array([21, 14, 7, 0], dtype=np.uint32)
+    groups = ((deltas[:, None] >> shifts) & 0x7F).astype(np.uint8)
+    groups[:, :3] |= 0x80
+    lengths = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    used = np.arange(4)[None, :] >= 4 - lengths[:, None]
+    return groups, used
+
+def note_messages(events, voice, channel):
+    # The track's note messages (delta time + 3 bytes each) as one bytes object.
+    pitch = np.frombuffer(events.pitch, dtype=np.int16)
+    onset = np.frombuffer(events.onset, dtype=np.float64)
+    duration = np.frombuffer(events.duration, dtype=np.float64)
+    rows = (np.frombuffer(events.voice, dtype=np.uint8) == voice) & (pitch != REST)
+    if not rows.any():
+        return b""
+
+    notes = pitch[rows].astype(np.uint8)
+    start = np.rint(onset[rows] * TICKS_PER_QUARTER).astype(np.int64)
+    end = np.rint((onset[rows] + duration[rows]) * TICKS_PER_QUARTER).astype(np.int64)
+
+    times = np.concatenate([end, start])
+    status = np.concatenate([np.full(len(notes), NOTE_OFF | channel), np.full(len(notes), NOTE_ON | channel)])
+    keys = np.concatenate([notes, notes])
+    velocity = np.concatenate([np.zeros(len(notes)), np.full(len(notes), VELOCITY)])
+    # Stable sort on time with note-offs first, so a repeated pitch is released before it is struck again.
+    order = np.argsort(times, kind="stable")
+
+    groups, used = encode_deltas(times[order])
+    messages = np.column_stack([status[order], keys[order], velocity[order]]).astype(np.uint8)
+    table = np.concatenate([groups, messages], axis=1)
+    mask = np.concatenate([used, np.ones(messages.shape, dtype=bool)], axis=1)
+    return table[mask].tobytes()
+
+def tracks_for(parts):
+    # TRACKS for musicxml.PARTS-style parts, such as an ensemble's.
+    return [(voice, name, channel - 1, program - 1) for voice, _, _, channel, name, _, program in parts]
+
+def track_chunk(name, channel, messages, header=b"", program=0):
+    body = (meta_event(0x03, name.encode("utf-8"))
+            + header
+            + b"\x00" + bytes([PROGRAM_CHANGE | channel, program])
+            + messages
+            + b"\x00\xff\x2f\x00")
+    return b"MTrk" + struct.pack(">I", len(body)) + body
+
+def write_midi(events, title, composer, selected_key, target, parts=None):
+    # target may be a path or any writable binary file-like object; parts
+    # (as in musicxml.PARTS) replace the two piano tracks.
+    tracks = TRACKS if parts is None else tracks_for(parts)
+    fifths, mode = key_signature(selected_key)
+    header = (meta_event(0x01, title.encode("utf-8"))
+              + meta_event(0x01, composer.encode("utf-8"))
+              + meta_event(0x51, TEMPO.to_bytes(3, "big"))
+              + meta_event(0x58, bytes([4, 2, 24, 8]))
+              + meta_event(0x59, struct.pack(">bB", fifths, mode == "minor")))
+
+    chunks = [b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), TICKS_PER_QUARTER)]
+    for index, (voice, name, channel, program) in enumerate(tracks):
+        messages = note_messages(events, voice, channel)
+        chunks.append(track_chunk(name, channel, messages, b"" if index else header, program))
+
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as f:
+            f.writelines(chunks)
+    else:
+        target.writelines(chunks)
+    return target
+
+def export_midi(events, title, composer, selected_key, target, profiler=None, parts=None):
+    with stage(profiler, "midi"):
+        return write_midi(events, title, composer, selected_key, target, parts)
@@ -0,0 +1,173 @@
+from xml.sax.saxutils import escape
+from events import RIGHT_HAND, LEFT_HAND
+from pitches import step_and_octave
+
+# Streaming MusicXML writer for generated scores.
+#
+# The generators only produce parts in one key (two piano staves unless an
+# ensemble passes its own parts), 4/4 time and durations on a sixteenth-note
+# grid, so the score can be written measure by measure straight from the
+# note events without building music21 objects or a DOM. Output re-parses in
+# music21 to the same notes as the general exporter.
+
+DIVISIONS = 4
+
+NOTE_TYPES = [
+    (4.0, "whole", 0), (3.5, "half", 2), (3.0, "half", 1), (2.0, "half", 0),
+    (1.75, "quarter", 2), (1.5, "quarter", 1), (1.0, "quarter", 0),
+    (0.75, "eighth", 1), (0.5, "eighth", 0), (0.25, "16th", 0)
+]
+
+SHARP_ORDER = "FCGDAEB"
+MAJOR_FIFTHS = {
+    "C": 0, "G": 1, "D": 2, "A": 3, "E": 4, "B": 5, "F#": 6, "C#": 7,
+    "F": -1, "Bb": -2, "Eb": -3, "Ab": -4, "Db": -5, "Gb": -6, "Cb": -7
+}
+MINOR_FIFTHS = {
+    "A": 0, "E": 1, "B": 2, "F#": 3, "C#": 4, "G#": 5, "D#": 6, "A#": 7,
+    "D": -1, "G": -2, "C": -3, "F": -4, "Bb": -5, "Eb": -6, "Ab": -7
+}
+
+# (voice, part id, clef, MIDI channel, name, abbreviation, General MIDI program),
+# channel and program counted from 1 as in MusicXML.
+PARTS = [
+    (RIGHT_HAND, "P1", ("G", 2), 1, "Piano", "Pno", 1),
+    (LEFT_HAND, "P2", ("F", 4), 2, "Piano", "Pno", 1)
+]
+
+SCORE_END = "</score-partwise>\n"
+
+ACCIDENTAL_NAMES = {-2: "flat-flat", -1: "flat", 0: "natural", 1: "sharp", 2: "double-sharp"}
+
+def key_signature(selected_key):
+    if selected_key.endswith("m"):
+        return MINOR_FIFTHS[selected_key[:-1]], "minor"
+    return MAJOR_FIFTHS[selected_key], "major"
+
+def key_alters(fifths):
+    if fifths >= 0:
+        return {step: 1 for step in SHARP_ORDER[:fifths]}
+    return {step: -1 for step in SHARP_ORDER[::-1][:-fifths]}
+
+def split_duration(quarter_length):
+    # Durations that no single (dotted) note can express become tied pieces.
+    pieces = []
+    remaining = quarter_length
+    while remaining > 0:
+        for ql, note_type, dots in NOTE_TYPES:
+            if ql <= remaining:
+                pieces.append((ql, note_type, dots))
+                remaining -= ql
+                break
+        else:
+            raise ValueError(f"Duration {quarter_length} is not on the sixteenth-note grid")
+    return pieces
+
+def write_header(out, title, composer, parts=PARTS):
+    out.write('<?xml version="1.0" encoding="utf-8"?>\n'
+              '<!DOCTYPE score-partwise  PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+              '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+              '<score-partwise version="4.0">\n')
+    out.write(f"  <work>\n    <work-title>{escape(title)}</work-title>\n  </work>\n")
+    out.write(f"  <movement-title>{escape(title)}</movement-title>\n")
+    out.write(f'  <identification>\n    <creator type="composer">{escape(composer)}</creator>\n  </identification>\n')
+    out.write("  <part-list>\n")
+    for _, part_id, _, channel, name, abbreviation, program in parts:
+        out.write(f'    <score-part id="{part_id}">\n'
+                  f"      <part-name>{escape(name)}</part-name>\n"
+                  f"      <part-abbreviation>{escape(abbreviation)}</part-abbreviation>\n"
+                  f'      <score-instrument id="{part_id}-I1">\n'
+                  f"        <instrument-name>{escape(name)}</instrument-name>\n"
+                  "      </score-instrument>\n"
+                  f'      <midi-instrument id="{part_id}-I1">\n'
+                  f"        <midi-channel>{channel}</midi-channel>\n"
+                  f"        <midi-program>{program}</midi-program>\n"
+                  "      </midi-instrument>\n"
+                  "    </score-part>\n")
+    out.write("  </part-list>\n")
+
+def write_attributes(out, fifths, mode, part_clef):
+    sign, line = part_clef
+    out.write("      <attributes>\n"
+              f"        <divisions>{DIVISIONS}</divisions>\n"
+              f"        <key>\n          <fifths>{fifths}</fifths>\n          <mode>{mode}</mode>\n        </key>\n"
+              "        <time>\n          <beats>4</beats>\n          <beat-type>4</beat-type>\n        </time>\n"
+              f"        <clef>\n          <sign>{sign}</sign>\n          <line>{line}</line>\n        </clef>\n"
+              "      </attributes>\n")
+
+def write_note(out, pitches, quarter_length, alters_in_effect):
+    pieces = split_duration(quarter_length)
+    accidentals = []
+    for midi, alter in pitches:
+        step_octave = step_and_octave(midi, alter)
+        if alters_in_effect.get(step_octave, alters_in_effect.get(step_octave[0], 0)) != alter:
+            alters_in_effect[step_octave] = alter
+            accidentals.append(ACCIDENTAL_NAMES[alter])
+        else:
+            accidentals.append(None)
+
+    for index, (ql, note_type, dots) in enumerate(pieces):
+        ties = []
+        if len(pieces) > 1:
+            if index > 0:
+                ties.append("stop")
+            if index < len(pieces) - 1:
+                ties.append("start")
+        if not pitches:
+            out.write("      <note>\n        <rest />\n")
+            write_duration(out, ql, note_type, dots, ties)
+            out.write("      </note>\n")
+            continue
+        for chord_index, (midi, alter) in enumerate(pitches):
+            step, octave = step_and_octave(midi, alter)
+            out.write("      <note>\n")
+            if chord_index:
+                out.write("        <chord />\n")
+            out.write(f"        <pitch>\n          <step>{step}</step>\n")
+            if alter:
+                out.write(f"          <alter>{alter}</alter>\n")
+            out.write(f"          <octave>{octave}</octave>\n        </pitch>\n")
+            accidental = accidentals[chord_index] if index == 0 else None
+            write_duration(out, ql, note_type, dots, ties, accidental)
+            out.write("      </note>\n")
+
+def write_duration(out, ql, note_type, dots, ties, accidental=None):
+    out.write(f"        <duration>{int(ql * DIVISIONS)}</duration>\n")
+    for tie in ties:
+        out.write(f'        <tie type="{tie}" />\n')
+    out.write(f"        <type>{note_type}</type>\n")
+    out.write("        <dot />\n" * dots)
+    if accidental:
+        out.write(f"        <accidental>{accidental}</accidental>\n")
+    if ties:
+        out.write("        <notations>\n")
+        for tie in ties:
+            out.write(f'          <tied type="{tie}" />\n')
+        out.write("        </notations>\n")
+
+def write_part(out, events, voice, part_id, part_clef, selected_key):
+    fifths, mode = key_signature(selected_key)
+    signature = key_alters(fifths)
+    out.write(f'  <part id="{part_id}">\n')
+    current_measure = None
+    alters_in_effect = None
+    for measure_index, pitches, dur in events.iter_voice(voice):
+        if measure_index != current_measure:
+            if current_measure is not None:
+                out.write("    </measure>\n")
+            out.write(f'    <measure number="{measure_index + 1}">\n')
+            if current_measure is None:
+                write_attributes(out, fifths, mode, part_clef)
+            current_measure = measure_index
+            alters_in_effect = dict(signature)
+        write_note(out, pitches, dur, alters_in_effect)
+    if current_measure is not None:
+        out.write("    </measure>\n")
+    out.write("  </part>\n")
+
+def write_musicxml(out, events, title, composer, selected_key, parts=PARTS):
+    # out is any text stream; nothing is buffered beyond the current note.
+    write_header(out, title, composer, parts)
+    for voice, part_id, part_clef, *_ in parts:
+        write_part(out, events, voice, part_id, part_clef, selected_key)
+    out.write(SCORE_END)
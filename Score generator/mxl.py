@@ -0,0 +1,109 @@
+import io
+import os
+import time
+import zipfile
+from musicxml import PARTS, write_musicxml
+from profiling import stage
+
+CONTAINER_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+   <rootfiles>
+      <rootfile full-path="{}" media-type="application/vnd.recordare.musicxml+xml"/>
+   </rootfiles>
+</container>'''
+
+COMPRESSIONS = {"deflated": zipfile.ZIP_DEFLATED, "stored": zipfile.ZIP_STORED}
+EXPORTERS = ["fast", "music21"]
+
+# Every entry gets this timestamp, so the same score always zips to the same bytes.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def file_name_for(title):
+    return title.replace(" ", "_")
+
+def zip_entry(zipf, filename):
+    info = zipfile.ZipInfo(filename, date_time=ZIP_DATE_TIME)
+    info.compress_type = zipf.compression
+    info._compresslevel = zipf.compresslevel  # as ZipFile.open() does for a plain name
+    info.external_attr = 0o600 << 16
+    return info
+
+def score_to_bytes(s):
+    from music21.musicxml import m21ToXml
+    exporter = m21ToXml.GeneralObjectExporter(s)
+    exporter.makeNotation = True
+    return exporter.parse()
+
+def write_mxl(s, target, compression=zipfile.ZIP_DEFLATED, compresslevel=None, profiler=None):
+    # target may be a path or any writable binary file-like object.
+    xml_filename = file_name_for(s.metadata.title) + ".xml"
+    with stage(profiler, "musicxml"):
+        xml_bytes = score_to_bytes(s)
+
+    with stage(profiler, "zip"):
+        write_zip(xml_filename, xml_bytes, target, compression, compresslevel)
+    return target
+
+def write_zip(xml_filename, xml_bytes, target, compression=zipfile.ZIP_DEFLATED, compresslevel=None):
+    with zipfile.ZipFile(target, "w", compression, compresslevel=compresslevel) as zipf:
+        zipf.writestr(zip_entry(zipf, xml_filename), xml_bytes)
+        zipf.writestr(zip_entry(zipf, "META-INF/container.xml"), CONTAINER_XML.format(xml_filename))
+
+def write_events_mxl(events, title, composer, selected_key, target,
+                     compression=zipfile.ZIP_DEFLATED, compresslevel=None, profiler=None, parts=PARTS):
+    # Streams the score into the zip entry with the fast writer, no music21 involved.
+    xml_filename = file_name_for(title) + ".xml"
+
+    with zipfile.ZipFile(target, "w", compression, compresslevel=compresslevel) as zipf:
+        zipf.writestr(zip_entry(zipf, "META-INF/container.xml"), CONTAINER_XML.format(xml_filename))
+        if profiler is None:
+            with zipf.open(zip_entry(zipf, xml_filename), "w", force_zip64=True) as entry:
+                with io.TextIOWrapper(entry, encoding="utf-8") as out:
+                    write_musicxml(out, events, title, composer, selected_key, parts)
+            return target
+
+        # Serialization and compression are interleaved, so the time spent in
+        # the zip entry is measured around its writes and reported as "zip".
+        with profiler.stage("musicxml") as frame:
+            entry = TimedWriter(zipf.open(zip_entry(zipf, xml_filename), "w", force_zip64=True))
+            with io.TextIOWrapper(entry, encoding="utf-8") as out:
+                write_musicxml(out, events, title, composer, selected_key, parts)
+            frame["excluded_ms"] = entry.ms
+    profiler.add("zip", entry.ms)
+    return target
+
+class TimedWriter(io.RawIOBase):
+    # Forwards writes to a binary file and adds up the time they take.
+    def __init__(self, raw):
+        self.raw = raw
+        self.ms = 0.0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        start = time.perf_counter()
+        n = self.raw.write(b)
+        self.ms += (time.perf_counter() - start) * 1000
+        return n
+
+    def close(self):
+        if not self.closed:
+            start = time.perf_counter()
+            self.raw.close()
+            self.ms += (time.perf_counter() - start) * 1000
+        super().close()
+
+def mxl_path_for(title, output_dir="."):
+    return os.path.join(output_dir, file_name_for(title) + ".mxl")
+
+def export_events(events, title, composer, selected_key, target, exporter="fast",
+                  compression=zipfile.ZIP_DEFLATED, compresslevel=None, profiler=None, parts=None):
+    # parts (as in musicxml.PARTS) replace the two piano staves.
+    if exporter == "music21":
+        from events import to_score
+        with stage(profiler, "music21"):
+            s = to_score(events, title, composer, selected_key, parts)
+        return write_mxl(s, target, compression, compresslevel, profiler)
+    return write_events_mxl(events, title, composer, selected_key, target, compression, compresslevel, profiler,
+                            PARTS if parts is None else parts)
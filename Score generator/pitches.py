@@ -0,0 +1,79 @@
+from functools import lru_cache
+
+# Integer pitch tables shared by all genres.
+#
+# A pitch is a (midi, alter) pair: the MIDI number plus the alteration that
+# spells it (-1 for Bb, +1 for A#), so spelling survives without strings.
+# Every table below is built once at import.
+
+LETTERS = "CDEFGAB"
+STEP_PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+STEPS = {pc: step for step, pc in STEP_PITCH_CLASSES.items()}
+ALTERS = {"": 0, "#": 1, "##": 2, "b": -1, "bb": -2}
+
+MAJOR_KEYS = ["C", "G", "D", "A", "E", "B", "F#", "C#", "F", "Bb", "Eb", "Ab", "Db", "Gb", "Cb"]
+MINOR_KEYS = ["Am", "Em", "Bm", "F#m", "C#m", "G#m", "D#m", "Dm", "Gm", "Cm", "Fm", "Bbm", "Ebm", "Abm"]
+
+PITCHES = {
+    letter + accidental + str(octave): ((octave + 1) * 12 + pc + alter, alter)
+    for letter, pc in STEP_PITCH_CLASSES.items()
+    for accidental, alter in ALTERS.items()
+    for octave in range(0, 9)
+}
+
+SHARP_SPELLINGS = [(midi, 0 if midi % 12 in STEPS else 1) for midi in range(128)]
+
+def parse_pitch(name):
+    try:
+        return PITCHES[name]
+    except KeyError:
+        raise ValueError(f"Invalid note format: {name}") from None
+
+def step_and_octave(midi, alter=0):
+    natural = midi - alter
+    return STEPS[natural % 12], natural // 12 - 1
+
+def transpose(pitch, semitones):
+    # Chromatic transposition, spelled with sharps like the original string version.
+    midi = pitch[0] if isinstance(pitch, tuple) else PITCHES[pitch][0]
+    return SHARP_SPELLINGS[midi + semitones]
+
+def letter_position(midi, alter=0):
+    natural = midi - alter
+    return (natural // 12) * 7 + LETTERS.index(STEPS[natural % 12])
+
+def natural_midi(position):
+    return (position // 7) * 12 + STEP_PITCH_CLASSES[LETTERS[position % 7]]
+
+def transpose_diatonic(pitch, semitones, steps):
+    # Moves the letter name by steps and the sound by semitones, keeping correct spelling.
+    midi, alter = pitch if isinstance(pitch, tuple) else PITCHES[pitch]
+    new_natural = natural_midi(letter_position(midi, alter) + steps)
+    return midi + semitones, midi + semitones - new_natural
+
+def key_tonic(selected_key):
+    return selected_key[:-1] if selected_key.endswith("m") else selected_key
+
+def build_key_transpositions(keys, reference):
+    # (semitones, steps) that move the reference key up onto each key.
+    transpositions = {}
+    ref_midi, ref_alter = PITCHES[key_tonic(reference) + "4"]
+    ref_position = letter_position(ref_midi, ref_alter)
+    for selected_key in keys:
+        midi, alter = PITCHES[key_tonic(selected_key) + "4"]
+        semitones = (midi - ref_midi) % 12
+        steps = (letter_position(midi, alter) - ref_position) % 7
+        if semitones - (natural_midi(ref_position + steps) - natural_midi(ref_position)) > 2:
+            steps += 7
+        transpositions[selected_key] = (semitones, steps)
+    return transpositions
+
+KEY_TRANSPOSITIONS = {
+    **build_key_transpositions(MAJOR_KEYS, "C"),
+    **build_key_transpositions(MINOR_KEYS, "Am")
+}
+
+@lru_cache(maxsize=None)
+def to_key(pitch, selected_key):
+    # Transposes a pitch written in C major (or A minor) into selected_key.
+    return transpose_diatonic(pitch, *KEY_TRANSPOSITIONS[selected_key])
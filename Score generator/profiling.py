@@ -0,0 +1,102 @@
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Stage-level timing for the generators.
+#
+# Pass a StageProfiler as generate_song(..., profiler=...) to record the wall
+# time of each stage (generation, music21, musicxml, zip, midi, audio).
+# Records are kept in .records and, if out is given, written to it as JSON
+# lines as they finish. With memory=True each record also gets the
+# tracemalloc peak of its stage; tracing slows the stages down several
+# times, so wall times from such a run are not comparable with plain ones.
+
+class StageProfiler:
+    def __init__(self, out=None, memory=False, **context):
+        self.out = out
+        self.memory = memory
+        self.context = context
+        self.records = []
+        # Open stages, innermost last: [base bytes, peak bytes] while tracing.
+        self._stack = []
+        self._tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        # Yields a dict; a stage that times part of its own work separately
+        # (see add()) sets "excluded_ms" in it to leave that out of wall_ms.
+        frame = {"excluded_ms": 0.0}
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # The peak is reset for this stage, so fold it into the enclosing one first.
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+        start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000 - frame["excluded_ms"]
+            record = dict(self.context, stage=name, wall_ms=round(wall_ms, 3))
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                base, stage_peak = self._stack.pop()
+                stage_peak = max(stage_peak, peak)
+                record["peak_kib"] = round((stage_peak - base) / 1024, 1)
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], stage_peak)
+                elif self._tracing:
+                    tracemalloc.stop()
+                    self._tracing = False
+            self._emit(record)
+
+    def add(self, name, wall_ms):
+        # Records a stage timed by the caller, e.g. work interleaved with another stage.
+        self._emit(dict(self.context, stage=name, wall_ms=round(wall_ms, 3)))
+
+    def _emit(self, record):
+        self.records.append(record)
+        if self.out is not None:
+            self.out.write(json.dumps(record) + "\n")
+            self.out.flush()
+
+def stage(profiler, name):
+    return nullcontext() if profiler is None else profiler.stage(name)
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage wall time as JSON lines")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="also trace each stage's peak memory (tracemalloc; slows every stage down)")
+    parser.add_argument("--profile-out", help="append the JSON lines to this file instead of stderr")
+    parser.add_argument("--pstats", help="also dump a cProfile stats file here")
+
+@contextmanager
+def profile_run(args, **context):
+    # Yields a StageProfiler (or None) configured from add_profile_arguments().
+    if not (args.profile or args.profile_memory or args.profile_out or args.pstats):
+        yield None
+        return
+
+    out = open(args.profile_out, "a") if args.profile_out else sys.stderr
+    profiler = StageProfiler(out=out, memory=args.profile_memory, **context)
+    cprofile = cProfile.Profile() if args.pstats else None
+    try:
+        if cprofile is not None:
+            cprofile.enable()
+        # Closing the outermost stage also stops the tracemalloc it started.
+        with profiler.stage("total"):
+            yield profiler
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.pstats)
+        if out is not sys.stderr:
+            out.close()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import GENRE_MODULES, get_genre
+from export import FORMATS, output_path_for
+from mxl import COMPRESSIONS, EXPORTERS
+
+# Song recipes: the few fields that fully determine a generated score.
+#
+#   {"genre": "jazz", "version": 1, "seed": 7, "key": "Eb", "measures": 16,
+#    "title": "My Song", "composer": "Me"}
+#
+# A recipe is a JSON line of well under 200 bytes instead of a stored file.
+# Materializing it reruns the genre with random.Random(seed), so the output is
+# byte-identical every time for the fast MusicXML writer, MIDI and WAV (the
+# music21 exporter stamps the current date into the file). The key is drawn
+# from the seed as usual and then replaced by the recipe's, so the key can be
+# changed in a recipe without changing anything else.
+
+RECIPE_FIELDS = ["genre", "version", "seed", "key", "measures", "title", "composer"]
+
+def make_recipe(genre, seed, title, composer, measures=16):
+    generator = get_genre(genre)
+    return {
+        "genre": genre,
+        "version": generator.version,
+        "seed": seed,
+        "key": generator.draw_key(random.Random(seed)),
+        "measures": measures,
+        "title": title,
+        "composer": composer
+    }
+
+def load_recipes(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def materialize(recipe, output=None, output_dir=".", output_format="mxl", **options):
+    # options are generate_song()'s export options: exporter, compression, compresslevel.
+    missing = [field for field in RECIPE_FIELDS if field not in recipe]
+    if missing:
+        raise ValueError(f"Recipe is missing {', '.join(missing)}")
+    generator = get_genre(recipe["genre"])
+    if recipe["version"] != generator.version:
+        raise ValueError(f"Recipe is for {recipe['genre']} version {recipe['version']}, "
+                         f"but the generator is version {generator.version}")
+    if output is None:
+        output = output_path_for(recipe["title"], output_dir, output_format)
+    return generator.generate_song(recipe["title"], recipe["composer"], seed=recipe["seed"], output=output,
+                                   output_format=output_format, selected_key=recipe["key"],
+                                   measures=recipe["measures"], **options)
+
+def materialize_one(job):
+    recipe, output_dir, output_format, options = job
+    return materialize(recipe, output_dir=output_dir, output_format=output_format, **options)
+
+def materialize_all(recipes, output_dir=".", output_format="mxl", workers=None, **options):
+    jobs = [(recipe, output_dir, output_format, options) for recipe in recipes]
+    chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(materialize_one, jobs, chunksize=chunksize))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write song recipes, or turn recipes into files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    make = commands.add_parser("make", help="print recipes as JSON lines")
+    make.add_argument("--genre", choices=GENRE_MODULES, required=True)
+    make.add_argument("--count", type=int, default=1)
+    make.add_argument("--seed", type=int, default=None, help="base seed; recipe n uses seed + n")
+    make.add_argument("--measures", type=int, default=16)
+    make.add_argument("--title", default="Song {n}", help="title template; fields: {n}, {genre}, {seed}")
+    make.add_argument("--composer", default="Song Generator", help="composer template; same fields as --title")
+
+    build = commands.add_parser("materialize", help="write the files for a JSONL file of recipes")
+    build.add_argument("recipes", help="JSONL file of recipes, or - for stdin")
+    build.add_argument("--format", choices=FORMATS, default="mxl")
+    build.add_argument("--output-dir", default=".")
+    build.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    build.add_argument("--exporter", choices=EXPORTERS, default="fast")
+    build.add_argument("--compression", choices=sorted(COMPRESSIONS), default="deflated")
+    build.add_argument("--compresslevel", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "make":
+        base_seed = args.seed if args.seed is not None else random.randrange(2**32)
+        for n in range(1, args.count + 1):
+            fields = {"n": n, "genre": args.genre, "seed": base_seed + n}
+            recipe = make_recipe(args.genre, base_seed + n, args.title.format(**fields),
+                                 args.composer.format(**fields), args.measures)
+            print(json.dumps(recipe))
+        return
+
+    if args.recipes == "-":
+        recipes = [json.loads(line) for line in sys.stdin if line.strip()]
+    else:
+        recipes = load_recipes(args.recipes)
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    paths = materialize_all(recipes, args.output_dir, args.format, args.jobs, exporter=args.exporter,
+                            compression=COMPRESSIONS[args.compression], compresslevel=args.compresslevel)
+    elapsed = time.perf_counter() - start
+    print(f"Materialized {len(paths)} recipes in {elapsed:.2f}s ({len(paths) / elapsed:.1f} songs/sec)")
+
+if __name__ == "__main__":
+    main()
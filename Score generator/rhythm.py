@@ -0,0 +1,70 @@
+import random
+from fractions import Fraction
+from itertools import accumulate
+
+# Precomputed rhythm tables for filling a measure.
+#
+# The jazz right hand used to draw durations one by one until the bar was
+# full, truncating the last note. RhythmTable enumerates every rhythm that
+# process can produce once, with the probability the process gives it, so a
+# measure's rhythm becomes a single weighted pick.
+
+def alias_tables(scaled):
+    # Vose's alias method: (acceptance probabilities, aliases) for weights
+    # scaled to average 1. Draw i uniformly, then keep it with
+    # probability[i], else take alias[i]. scaled is consumed.
+    n = len(scaled)
+    probability = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        probability[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    return probability, alias
+
+class AliasSampler:
+    # O(1) weighted sampling after O(n) setup, from alias_tables().
+    __slots__ = ("probability", "alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        self.probability, self.alias = alias_tables([w * n / total for w in weights])
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.probability))
+        return i if rng.random() < self.probability[i] else self.alias[i]
+
+class RhythmTable:
+    def __init__(self, durations, weights=None, measure_length=4.0, sampler="cumulative"):
+        if weights is None:
+            weights = [1] * len(durations)
+        total = sum(weights)
+        draws = [(Fraction(d), Fraction(w) / total) for d, w in zip(durations, weights) if w]
+
+        table = {}
+        def expand(prefix, remaining, probability):
+            for dur, p in draws:
+                if dur >= remaining:
+                    rhythm = prefix + (remaining,)
+                    table[rhythm] = table.get(rhythm, 0) + probability * p
+                else:
+                    expand(prefix + (dur,), remaining - dur, probability * p)
+        expand((), Fraction(measure_length), Fraction(1))
+
+        self.rhythms = [tuple(float(d) for d in rhythm) for rhythm in table]
+        self.weights = [float(p) for p in table.values()]
+        self.cum_weights = list(accumulate(self.weights))
+        self.alias = AliasSampler(self.weights) if sampler == "alias" else None
+
+    def __len__(self):
+        return len(self.rhythms)
+
+    def sample(self, rng=random):
+        if self.alias is not None:
+            return self.rhythms[self.alias.sample(rng)]
+        return rng.choices(self.rhythms, cum_weights=self.cum_weights)[0]
@@ -0,0 +1,32 @@
+import random
+import numpy as np
+
+# Vectorized melody sampling.
+#
+# Melodies are drawn as a songs x measures x beats tensor of scale-degree
+# indices in one call. Position-dependent exclusion rules are applied as
+# boolean masks: every masked hit is redrawn until no rule is broken, so the
+# Python loop runs once per resampling round, never per note or per song.
+
+def rng_from_random(rng=random):
+    # A numpy Generator seeded from a random.Random (or the random module), so
+    # one seeded generator drives every draw of a song.
+    return np.random.default_rng(rng.getrandbits(64))
+
+def excluded(degrees, exclusions):
+    hits = np.zeros(degrees.shape, dtype=bool)
+    for forbidden, measure_mask in exclusions:
+        forbidden = np.asarray(forbidden, dtype=degrees.dtype)[:, None, None]
+        hits |= (degrees == forbidden) & np.asarray(measure_mask, dtype=bool)[None, :, None]
+    return hits
+
+def sample_scale_degrees(rng, songs, measures, beats, scale_size, exclusions=()):
+    # exclusions: (forbidden, measure_mask) pairs. forbidden holds one scale
+    # index per song (-1 for none) and measure_mask is a boolean array over
+    # the measures where that degree may not appear.
+    degrees = rng.integers(0, scale_size, size=(songs, measures, beats), dtype=np.int8)
+    hits = excluded(degrees, exclusions)
+    while hits.any():
+        degrees[hits] = rng.integers(0, scale_size, size=int(hits.sum()), dtype=np.int8)
+        hits = excluded(degrees, exclusions)
+    return degrees
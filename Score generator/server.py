@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from engine import GENRE_MODULES, get_genre
+from export import EXTENSIONS, FORMATS
+from mxl import COMPRESSIONS, EXPORTERS, file_name_for
+from worker import song_options, warm_up
+
+# Local HTTP generation service (asyncio, standard library only).
+#
+#   POST /generate   JSON body as for worker.py; responds with the file bytes
+#   GET  /metrics    queue depth, batches and latency percentiles as JSON
+#   GET  /health     "ok"
+#
+# Requests wait in a bounded queue; when it is full the server answers 503
+# with Retry-After instead of queueing more. A batcher takes up to
+# --batch-size requests (waiting at most --batch-wait-ms for the batch to
+# fill) and hands the whole batch to one process of a warm pool, so a burst
+# of small songs costs one inter-process round trip per batch, not per song.
+# Workers write each song to a file in a spool directory and pass back only
+# its path; the handler streams the file to the client and deletes it, so
+# a response is never held in memory whole. WAV files are about 170 KiB per
+# measure, so they get their own, lower measure limit.
+
+CONTENT_TYPES = {
+    "mxl": "application/vnd.recordare.musicxml",
+    "midi": "audio/midi",
+    "wav": "audio/wav"
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+MAX_BODY = 64 * 1024
+WRITE_CHUNK = 64 * 1024
+LATENCY_WINDOW = 10_000
+MAX_MEASURES = 4096
+MAX_WAV_MEASURES = 256
+
+# Set in each pool process by init_pool().
+GENERATORS = None
+SPOOL = None
+
+def init_pool(preload_music21, spool):
+    global GENERATORS, SPOOL
+    GENERATORS = warm_up(preload_music21)
+    SPOOL = spool
+
+def render_batch(requests):
+    # Runs in a pool process: (True, path of the song in the spool) or
+    # (False, error) per request.
+    results = []
+    for request in requests:
+        fd, path = tempfile.mkstemp(dir=SPOOL)
+        os.close(fd)
+        try:
+            title, composer, options = song_options(request)
+            options["output"] = path
+            GENERATORS[request["genre"]].generate_song(title, composer, seed=request.get("seed"), **options)
+            results.append((True, path))
+        except Exception as e:
+            os.remove(path)
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+class GenerationService:
+    def __init__(self, workers=None, queue_size=256, batch_size=16, batch_wait=0.005, preload_music21=False,
+                 max_measures=MAX_MEASURES, max_wav_measures=MAX_WAV_MEASURES):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_measures = max_measures
+        self.max_wav_measures = max_wav_measures
+        self.spool = tempfile.mkdtemp(prefix="songgen-spool-")
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        # Spawned, not forked: a forked worker would inherit open client
+        # sockets and keep those connections from closing.
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_pool, initargs=(preload_music21, self.spool))
+        # At most one batch per pool process in flight; the rest wait in the queue.
+        self.slots = asyncio.Semaphore(self.workers)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0, "batches": 0, "in_flight": 0}
+
+    async def start(self):
+        # Starts and warms every pool process before the first request arrives.
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, render_batch, []) for _ in range(self.workers)))
+
+    def submit(self, request):
+        # A future for the song's bytes, or None when the queue is full.
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((request, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return None
+        return future
+
+    async def run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.counters["batches"] += 1
+            self.counters["in_flight"] += len(batch)
+            loop.create_task(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.pool, render_batch, [request for request, _, _ in batch])
+        except Exception as e:
+            results = [(False, f"{type(e).__name__}: {e}")] * len(batch)
+        finally:
+            self.slots.release()
+            self.counters["in_flight"] -= len(batch)
+        now = time.perf_counter()
+        for (_, future, queued_at), (ok, value) in zip(batch, results):
+            self.latencies.append((now - queued_at) * 1000)
+            self.counters["completed" if ok else "failed"] += 1
+            if not future.done():
+                future.set_result((ok, value))
+            elif ok:
+                os.remove(value)
+
+    def metrics(self):
+        ordered = sorted(self.latencies)
+        return dict(
+            self.counters,
+            queue_depth=self.queue.qsize(),
+            queue_size=self.queue.maxsize,
+            workers=self.workers,
+            mean_batch_size=round((self.counters["completed"] + self.counters["failed"])
+                                  / max(self.counters["batches"], 1), 2),
+            latency_ms={"p50": percentile(ordered, 0.50), "p90": percentile(ordered, 0.90),
+                        "p99": percentile(ordered, 0.99), "samples": len(ordered)}
+        )
+
+def validate(request, max_measures=MAX_MEASURES, max_wav_measures=MAX_WAV_MEASURES):
+    # An error message for the client, or None when the request can be generated.
+    if not isinstance(request, dict):
+        return "request must be a JSON object"
+    if not is_choice(request.get("genre"), GENRE_MODULES):
+        return f"genre must be one of {', '.join(GENRE_MODULES)}"
+    if not is_choice(request.get("format", "mxl"), FORMATS):
+        return f"format must be one of {', '.join(FORMATS)}"
+    if "output" in request or "output_dir" in request:
+        return "output and output_dir are not accepted; the file is returned in the response"
+    if "melody_model" in request:
+        return "melody_model is not accepted; the server does not open files named by clients"
+    keys = get_genre(request["genre"]).keys
+    if request.get("key") is not None and not is_choice(request["key"], keys):
+        return f"key must be one of {', '.join(keys)}"
+    if not is_choice(request.get("exporter", "fast"), EXPORTERS):
+        return f"exporter must be one of {', '.join(EXPORTERS)}"
+    if not is_choice(request.get("compression", "deflated"), COMPRESSIONS):
+        return f"compression must be one of {', '.join(sorted(COMPRESSIONS))}"
+    compresslevel = request.get("compresslevel")
+    if compresslevel is not None and not (is_int(compresslevel) and 0 <= compresslevel <= 9):
+        return "compresslevel must be an integer from 0 to 9"
+    measures = request.get("measures", 16)
+    if request.get("format") == "wav":
+        max_measures = min(max_measures, max_wav_measures)
+    if not (is_int(measures) and 1 <= measures <= max_measures):
+        return f"measures must be an integer from 1 to {max_measures}"
+    if request.get("seed") is not None and not is_int(request["seed"]):
+        return "seed must be an integer"
+    for field in ("title", "composer"):
+        if not isinstance(request.get(field, ""), str):
+            return f"{field} must be a string"
+    return None
+
+def is_choice(value, choices):
+    # Checked as a string first: JSON lists and objects are unhashable.
+    return isinstance(value, str) and value in choices
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+async def send(writer, status, body, content_type="application/json", headers=()):
+    head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", *headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+    for start in range(0, len(body), WRITE_CHUNK):
+        writer.write(body[start:start + WRITE_CHUNK])
+        await writer.drain()
+    await writer.drain()
+
+async def send_file(writer, status, path, content_type, headers=()):
+    # Streams the file in WRITE_CHUNK pieces, waiting for each to drain.
+    head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+            f"Content-Length: {os.path.getsize(path)}", *headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(WRITE_CHUNK), b""):
+            writer.write(chunk)
+            await writer.drain()
+
+async def send_json(writer, status, value, headers=()):
+    await send(writer, status, json.dumps(value).encode("utf-8"), headers=headers)
+
+async def read_request(reader):
+    # (method, path, headers, body), or None when the client closed the connection.
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        return method, path, headers, None
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+async def handle_generate(service, writer, body):
+    try:
+        request = json.loads(body)
+    except json.JSONDecodeError as e:
+        await send_json(writer, 400, {"error": f"invalid JSON: {e}"})
+        return
+    error = validate(request, service.max_measures, service.max_wav_measures)
+    if error:
+        await send_json(writer, 400, {"error": error})
+        return
+
+    future = service.submit(request)
+    if future is None:
+        await send_json(writer, 503, {"error": "queue full"}, headers=["Retry-After: 1"])
+        return
+    ok, value = await future
+    if not ok:
+        await send_json(writer, 500, {"error": value})
+        return
+    output_format = request.get("format", "mxl")
+    filename = re.sub(r"[^\w.-]", "_", file_name_for(request.get("title", "Untitled")), flags=re.ASCII)
+    filename += EXTENSIONS[output_format]
+    try:
+        await send_file(writer, 200, value, CONTENT_TYPES[output_format],
+                        headers=[f'Content-Disposition: attachment; filename="{filename}"'])
+    finally:
+        os.remove(value)
+
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError):
+                await send_json(writer, 400, {"error": "malformed request"})
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            if body is None:
+                # The oversized body was not read, so the connection cannot be reused.
+                await send_json(writer, 413, {"error": f"request body over {MAX_BODY} bytes"})
+                break
+            if method == "POST" and path == "/generate":
+                await handle_generate(service, writer, body)
+            elif method == "GET" and path == "/metrics":
+                await send_json(writer, 200, service.metrics())
+            elif method == "GET" and path == "/health":
+                await send(writer, 200, b"ok", "text/plain")
+            else:
+                await send_json(writer, 404, {"error": f"no route for {method} {path}"})
+            if headers.get("connection", "").lower() == "close":
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, **service_options):
+    service = GenerationService(**service_options)
+    await service.start()
+    batcher = asyncio.create_task(service.run_batcher())
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    print(f"serving on http://{host}:{port} with {service.workers} workers", file=sys.stderr)
+    # SIGTERM cancels serving like Ctrl-C, so the pool and spool are cleaned up.
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.cancel()
+        service.pool.shutdown(cancel_futures=True)
+        shutil.rmtree(service.spool, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve song generation over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=256,
+                        help="requests that may wait; more are rejected with 503")
+    parser.add_argument("--batch-size", type=int, default=16, help="most requests sent to a worker at once")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0,
+                        help="how long a batch waits to fill before it is dispatched")
+    parser.add_argument("--max-measures", type=int, default=MAX_MEASURES,
+                        help="longest piece a request may ask for; longer requests get 400")
+    parser.add_argument("--max-wav-measures", type=int, default=MAX_WAV_MEASURES,
+                        help="longest WAV a request may ask for (about 170 KiB per measure)")
+    parser.add_argument("--music21", action="store_true",
+                        help="preload music21 in the workers for requests using the music21 exporter")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.jobs, queue_size=args.queue_size,
+                          batch_size=args.batch_size, batch_wait=args.batch_wait_ms / 1000,
+                          preload_music21=args.music21, max_measures=args.max_measures,
+                          max_wav_measures=args.max_wav_measures))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
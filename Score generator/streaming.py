@@ -0,0 +1,45 @@
+from events import RIGHT_HAND, LEFT_HAND
+
+# Incremental measure streams for pieces of any length.
+#
+# A genre's stream_measures() draws the key up front and returns a
+# MeasureStream that yields (right_hand, left_hand) measures lazily, in the
+# generators' (note_or_chord, duration, accidental) format, for as long as it
+# is iterated. Nothing is kept per measure, so memory stays flat however many
+# are pulled. end() returns the genre's closing measures and stops the stream.
+
+class MeasureStream:
+    def __init__(self, selected_key, body, ending):
+        self.selected_key = selected_key
+        self.measure_index = 0
+        self._body = body
+        self._ending = ending
+        self.ended = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.ended:
+            raise StopIteration
+        measure = next(self._body)
+        self.measure_index += 1
+        return measure
+
+    def end(self):
+        # The closing cadence; the stream yields nothing afterwards.
+        if self.ended:
+            return []
+        self.ended = True
+        closing = self._ending(self.selected_key)
+        self.measure_index += len(closing)
+        return closing
+
+def add_measures(events, measures, first_index):
+    # Appends (right_hand, left_hand) measures to a NoteEvents starting at
+    # measure index first_index; returns the index after the last one.
+    for right_hand, left_hand in measures:
+        events.add_measure(LEFT_HAND, first_index, left_hand)
+        events.add_measure(RIGHT_HAND, first_index, right_hand)
+        first_index += 1
+    return first_index
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from cache import DEFAULT_MAX_BYTES, OutputCache
+from engine import load_genres
+from mxl import COMPRESSIONS
+
+# Long-lived generation worker.
+#
+# Imports the genre modules (and by default music21) once, then answers
+# JSONL requests such as
+#   {"id": 1, "genre": "jazz", "seed": 7, "title": "Song", "composer": "Me", "output": "song.mxl"}
+# with one result line each, e.g.
+#   {"id": 1, "ok": true, "path": "song.mxl", "elapsed_ms": 1.9}
+# Requests may give "output_dir" instead of "output", plus "format",
+# "exporter", "compression" and "compresslevel" as in batch.py, and "key" and
+# "measures" as in a recipe (see recipe.py), and "melody_model", the path of
+# a model trained by markov.py. With a cache, seeded requests are
+# served from it when possible and results carry "cached".
+
+def warm_up(preload_music21=True):
+    generators = load_genres()
+    if preload_music21:
+        import music21.musicxml.m21ToXml  # noqa: F401
+    return generators
+
+def song_options(request):
+    # (title, composer, generate_song() keyword arguments) for a request.
+    title = request.get("title", "Untitled")
+    composer = request.get("composer", "Song Generator")
+    options = {
+        "output_dir": request.get("output_dir", "."),
+        "exporter": request.get("exporter", "fast"),
+        "compression": COMPRESSIONS[request.get("compression", "deflated")],
+        "compresslevel": request.get("compresslevel"),
+        "output": request.get("output"),
+        "output_format": request.get("format", "mxl"),
+        "selected_key": request.get("key"),
+        "measures": request.get("measures", 16),
+        "melody_model": request.get("melody_model")
+    }
+    return title, composer, options
+
+def handle_request(generators, request, cache=None):
+    start = time.perf_counter()
+    try:
+        generator = generators[request["genre"]]
+        title, composer, options = song_options(request)
+        if cache is None:
+            path = generator.generate_song(title, composer, seed=request.get("seed"), **options)
+            result = {"ok": True, "path": path}
+        else:
+            path, hit = cache.generate_song(generator, request["genre"], title, composer, request.get("seed"), **options)
+            result = {"ok": True, "path": path, "cached": hit}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    if "id" in request:
+        result["id"] = request["id"]
+    return result
+
+def serve_lines(generators, lines, write, cache=None, lock=None):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            result = {"ok": False, "error": f"invalid JSON: {e}"}
+        else:
+            with lock or nullcontext():
+                result = handle_request(generators, request, cache)
+        write(json.dumps(result) + "\n")
+
+def serve_stdin(generators, cache=None):
+    def write(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    serve_lines(generators, sys.stdin, write, cache)
+
+def remove_stale_socket(path):
+    # Removes a socket left behind by a worker that is gone. Anything that is
+    # not a socket, or a socket another worker still listens on, is left
+    # alone and raises FileExistsError.
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return
+    raise FileExistsError(f"another process is listening on {path}")
+
+def serve_socket(generators, path, cache=None):
+    # Every connection gets its own thread, so a client that keeps its
+    # connection open does not lock others out. Generation is CPU-bound and
+    # holds the GIL, so requests are still handled one at a time, under a
+    # lock that also keeps the cache and music21 single-threaded; run more
+    # workers for parallel generation.
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(text):
+                self.wfile.write(text.encode("utf-8"))
+                self.wfile.flush()
+            serve_lines(generators, (line.decode("utf-8") for line in self.rfile), write, cache, lock)
+
+    remove_stale_socket(path)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve generation requests from a warm process.")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of stdin/stdout")
+    parser.add_argument("--no-music21", action="store_true",
+                        help="skip preloading music21 (only the fast exporter will be warm)")
+    parser.add_argument("--cache-dir", help="serve repeated seeded requests from this cache directory")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="evict least recently used cache entries above this size")
+    args = parser.parse_args(argv)
+    if args.socket:
+        # Checked before the warm-up, so a bad path fails at once.
+        try:
+            remove_stale_socket(args.socket)
+        except FileExistsError as e:
+            parser.error(str(e))
+
+    start = time.perf_counter()
+    generators = warm_up(preload_music21=not args.no_music21)
+    cache = OutputCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    print(f"worker ready in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    try:
+        if args.socket:
+            serve_socket(generators, args.socket, cache)
+        else:
+            serve_stdin(generators, cache)
+    finally:
+        if cache is not None:
+            print(json.dumps({"cache": cache.stats()}), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()